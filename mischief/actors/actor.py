@@ -16,13 +16,18 @@ implements the method ``act()``::
 .. _actor model: http://en.wikipedia.org/wiki/Actor_model
 """
 
+import logging
 import pprint
 import threading
-from six.moves import queue
 import time
+import traceback
 import uuid
 
-from .pipe import Receiver, Sender, is_local_ip, get_local_ip
+from .pipe import (Receiver, Sender, Mailbox, ConflatingMailbox,
+                   close_receivers, is_local_ip, get_local_ip)
+from . import tracing
+from .message import Message
+from .durable import DurableMailbox
 from ..log import setup, show_msg
 from ..exceptions import ActorFinished, PipeEmpty, PipeException
 from ..tools import Addressable
@@ -123,9 +128,11 @@ class ActorRef(Addressable):
             if is_local_ip(ip):
                 ip = get_local_ip(self.ip)
             msg['reply_to'] = (name, ip, port)
+        tracing.inject(msg)
         self.sender.put(msg)
-        logger.debug('ref --> {}\n{}'.
-                     format(self.name, show_msg(msg, indent=4)))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('ref --> {}\n{}'.
+                         format(self.name, show_msg(msg, indent=4)))
 
     def close(self):
         """
@@ -153,22 +160,67 @@ class Actor(Addressable):
 
       {'tag': 'foo',
        ...}
+
+    Set ``CONFLATE`` in a subclass to keep only the newest pending
+    message for some tags (see ``ConflatingMailbox``)::
+
+      class Display(ThreadedActor):
+          CONFLATE = {'progress': None, 'position': 'id'}
+
+    Set ``DURABLE`` to log the inbox to disk, and replay the messages
+    not processed yet when an actor with the same name is created
+    again (see ``DurableMailbox``).  It cannot be combined with
+    ``CONFLATE``.
     """
 
     # When a timeout is given in a ``receive``, check every
     # ``INBOX_POLLING_TIMEOUT`` seconds whether we have timed out.
     INBOX_POLLING_TIMEOUT = 0.01
 
+    # Map of tags to conflate in the mailbox, to the field used as
+    # key (or ``None``)
+    CONFLATE = None
+
+    # Whether to use a ``DurableMailbox`` for the inbox
+    DURABLE = False
+
+    # Address of a ``Supervisor`` to notify when ``act`` finishes
+    supervisor = None
+
     def __init__(self, name=None, ip='localhost', remote=True):
         self.name = name or gen_name()
         self.ip = ip
-        self.inbox = Receiver(self.name, self.ip, use_remote=remote)
+        self.inbox = Receiver(self.name, self.ip, use_remote=remote,
+                              mailbox=self.make_mailbox())
         logger.debug('{} created ({})'
                      .format(self.name, self.__class__.__name__))
 
     def address(self):
         return self.inbox.address()
 
+    def export(self):
+        """Make the actor reachable from other hosts (see
+        ``Receiver.export``) and return its address."""
+        return self.inbox.export()
+
+    def subscribe(self, publisher, *topics):
+        """Receive the messages of ``publisher`` (a ``Publisher`` or its
+        address) in ``topics``, through the usual ``receive``."""
+        self.inbox.subscribe(publisher, topics)
+
+    def unsubscribe(self, publisher=None, *topics):
+        self.inbox.unsubscribe(publisher, topics or None)
+
+    def make_mailbox(self):
+        """Create the queue for the inbox of the actor."""
+        if self.DURABLE:
+            if self.CONFLATE:
+                raise ValueError('CONFLATE and DURABLE cannot be combined')
+            return DurableMailbox(self.name)
+        if self.CONFLATE:
+            return ConflatingMailbox(self.CONFLATE)
+        return Mailbox()
+
     def __enter__(self):
         """
         Actor can be used as a context
@@ -179,25 +231,83 @@ class Actor(Addressable):
         """
         Actor context closes it on exit
         """
-        try:
-            with ActorRef(self.address()) as myself:
-                myself.close_actor()
-            logger.debug('{} destroyed (via "with")'.format(self.name))
-        except PipeException:
-            # If actor was already closed, ignore error from the
-            # reference trying to ping the actor
-            pass
+        # close the inbox directly: nothing happens if the actor was
+        # already closed
+        self.inbox.close()
+        logger.debug('{} destroyed (via "with")'.format(self.name))
+        self._wait_closed()
 
     def close(self, confirm_to=None):
         confirm_msg = {'tag': 'closed'}
         self.inbox.close(confirm_to, confirm_msg)
         logger.debug('{} destroyed'.format(self.name))
+        self._wait_closed()
+
+    def _wait_closed(self):
+        """
+        Wait for a durable inbox to release its log, so an actor with
+        the same name can open it again.
+        """
+        if self.DURABLE:
+            self.inbox.wait_closed()
+
+    def instance(self):
+        """Identify this incarnation of the actor for its supervisor."""
+        return id(self)
+
+    def notify_exit(self, reason=None):
+        """
+        Tell the supervisor that ``act`` finished.  ``reason`` is
+        ``None`` for a normal exit, or the traceback of a crash.
+        """
+        if self.supervisor is None:
+            return
+        try:
+            with ActorRef(self.supervisor) as ref:
+                ref.child_exited(name=self.name,
+                                 instance=self.instance(),
+                                 reason=reason)
+        except PipeException:
+            logger.debug('{} could not notify its supervisor'
+                         .format(self.name))
 
     def read_value(self, value_name):
         def _f(msg):
             setattr(self, value_name, msg[value_name])
         return _f
 
+    def compile_patterns(self, patterns=None, **more_patterns):
+        """
+        Build a ``Patterns`` table to use in ``receive`` or
+        ``receive_loop``.
+
+        The table contains the methods decorated with ``handles``,
+        plus ``patterns`` (which have the same form as in
+        ``receive``). Actions are resolved to callables once.
+
+        """
+        table = Patterns()
+        for klass in reversed(type(self).__mro__):
+            for name, method in vars(klass).items():
+                for tag in getattr(method, '_handles', ()):
+                    table[tag] = getattr(self, name)
+        if patterns is not None:
+            more_patterns = dict(patterns, **more_patterns)
+        for tag, action in more_patterns.items():
+            table[tag] = self._resolve(action)
+        return table
+
+    def _resolve(self, action):
+        if isinstance(action, str):
+            # a string means a method of self (for those cases the
+            # method is added later)
+            return getattr(self, action)
+        if action is None:
+            # None is a shortcut for an empty handler
+            return _ignore
+        # a callable can be methods or functions
+        return action
+
     def receive(self, patterns=None, timeout=None, **more_patterns):
         """
         ``patterns`` have the form::
@@ -206,20 +316,78 @@ class Actor(Addressable):
            a_tag_2: a_function,
            ...}
 
+        or they are a ``Patterns`` table built with
+        ``compile_patterns``.
+
         Special tags are:
 
         * ``*``: matches any tag
         * ``timeout``: is executed when a ``receive`` times out
 
+        The message is acknowledged to the inbox after the action
+        returns (see ``DurableMailbox``).  Messages with a trace
+        context are handled in a span (see ``tracing``).
+
         """
         if patterns is None:
             patterns = {}
-        patterns.update(more_patterns)
+        if not isinstance(patterns, Patterns):
+            patterns.update(more_patterns)
+        elif more_patterns:
+            patterns = self.compile_patterns(patterns, **more_patterns)
+
+        matched, msg = self._match(patterns, timeout)
+        try:
+            action = patterns[matched]
+        except KeyError:
+            return
+        if not isinstance(patterns, Patterns):
+            action = self._resolve(action)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('{} <-- received:\n{}'.
+                         format(self.name, show_msg(msg, indent=4)))
+        if msg.trace is not None:
+            tracing.handle(self, action, msg)
+        else:
+            action(msg)
+        self.inbox.ack(msg)
+
+    def receive_loop(self, table=None):
+        """
+        Dispatch messages with the ``Patterns`` table ``table``
+        forever (that is, until the actor is closed).
+
+        By default, use the table of the methods decorated with
+        ``handles``.
+
+        """
+        if table is None:
+            table = self.compile_patterns()
+        match = self._match
+        ack = self.inbox.ack
+        debug = logger.isEnabledFor
+        while True:
+            matched, msg = match(table, None)
+            if debug(logging.DEBUG):
+                logger.debug('{} <-- received:\n{}'.
+                             format(self.name, show_msg(msg, indent=4)))
+            if msg.trace is not None:
+                tracing.handle(self, table[matched], msg)
+            else:
+                table[matched](msg)
+            ack(msg)
+
+    def _match(self, patterns, timeout):
+        """
+        Take from the inbox the first message matching ``patterns``.
+
+        Return the matched tag and the message, or ``'timed_out'``
+        and an empty message.
 
+        """
         inbox_polling = timeout and self.INBOX_POLLING_TIMEOUT
-        processed = queue.Queue()
+        processed = None
         start_time = current_time = time.time()
-        msg = {}
         starting_size = self.inbox.qsize()
         checked_objects = 0
         while True:
@@ -229,6 +397,7 @@ class Actor(Addressable):
                     and timeout is not None
                     and current_time > start_time + timeout):
                 matched = 'timed_out'
+                msg = Message({})
                 break
             current_time = time.time()
             try:
@@ -239,47 +408,35 @@ class Actor(Addressable):
             except PipeEmpty:
                 continue
             try:
-                if msg['tag'] == '_debug':
+                tag = msg.tag
+                if tag == '_debug':
                     # Special handler for _debug, since we don't want
                     # to break the loop
                     self._debug(msg, patterns)
+                    self.inbox.ack(msg)
                     continue
-                if msg['tag'] in patterns:
-                    matched = msg['tag']
+                if tag in patterns:
+                    matched = tag
                     break
                 if '_' in patterns:
                     matched = '_'
                     break
-            except (KeyError, TypeError):
+            except (AttributeError, TypeError):
                 continue
             # the object 'msg' was not matched, save it so we can
             # return it to the inbox
-            processed.put(msg)
+            if processed is None:
+                processed = []
+            processed.append(msg)
         # Return all unmatched objects to the inbox
-        while not processed.empty():
-            x = processed.get()
-            # restore unprocessed object directly to the reader queue,
-            # bypassing the fifo, to avoid overhead.  This is possible
-            # because we have a reference to the read end of the
-            # pipe.
-            self.inbox.reader_queue.put(x)
-        try:
-            action = patterns[matched]
-        except KeyError:
-            return
-        if isinstance(action, str):
-            # a string means a method of self (for those cases the
-            # method is added later)
-            f = getattr(self, action)
-        elif callable(action):
-            # a callable can be methods or functions
-            f = action
-        elif action is None:
-            # None is a shortcut for an empty handler
-            f = lambda msg: None
-        logger.debug('{} <-- received:\n{}'.
-                     format(self.name, show_msg(msg, indent=4)))
-        f(AttributeDict(msg))
+        if processed is not None:
+            for x in processed:
+                # restore unprocessed object directly to the reader
+                # queue, bypassing the fifo, to avoid overhead.  This
+                # is possible because we have a reference to the read
+                # end of the pipe.
+                self.inbox.unread(x)
+        return matched, msg
 
     def _debug(self, msg, patterns):
         """Special method to respond to a _debug message.
@@ -299,8 +456,47 @@ class Actor(Addressable):
         raise NotImplementedError
 
 
+def handles(*tags):
+    """
+    Decorator to declare the tags handled by a method.
+
+    Use as::
+
+        class MyActor(ThreadedActor):
+
+            @handles('tick')
+            def tick(self, msg):
+                ...
+
+            def act(self):
+                self.receive_loop()
+
+    """
+    def decorator(method):
+        method._handles = getattr(method, '_handles', ()) + tags
+        return method
+    return decorator
+
+
+def _ignore(msg):
+    pass
+
+
+class Patterns(dict):
+    """
+    A dispatch table from tags to callables.
+
+    Build it with ``Actor.compile_patterns``.
+    """
+
+
 class AttributeDict(dict):
-    """A dict that can access keys via attributes"""
+    """A dict that can access keys via attributes.
+
+    Kept for compatibility: ``receive`` now hands ``Message``
+    envelopes to the handlers, which support the same access.
+
+    """
 
     def __getattr__(self, attr):
         return self[attr]
@@ -326,6 +522,12 @@ class ThreadedActor(Actor):
             self.act()
         except ActorFinished:
             pass
+        except Exception:
+            if self.supervisor is None:
+                raise
+            self.notify_exit(traceback.format_exc())
+            return
+        self.notify_exit()
 
     @staticmethod
     def spawn(actor, name=None, ip='localhost', **kwargs):
@@ -344,10 +546,9 @@ class Echo(ThreadedActor):
         super(Echo, self).__init__(name='echo', ip=ip)
 
     def act(self):
-        while True:
-            self.receive(
-                _=self.echo)
+        self.receive_loop()
 
+    @handles('_')
     def echo(self, msg):
         print('[Echo]')
         pprint.pprint(msg, width=1)
@@ -388,6 +589,38 @@ class Wait(Actor):
         self.receive()
 
 
+def close_all(actors, confirm=None):
+    """
+    Close many actors at once.
+
+    Actors of this process are closed directly and waited for.  Their
+    names are unregistered from the namebroker in a single request,
+    and ``confirm`` (an address), if given, gets a single message::
+
+        {'tag': 'closed', 'names': [...]}
+
+    once all of them are closed.  Other actors (``ActorRef``s,
+    proxies of process actors or addresses) are just told to close.
+    """
+    inboxes = []
+    for actor in actors:
+        inbox = getattr(actor, 'inbox', None)
+        if inbox is not None:
+            inboxes.append(inbox)
+            continue
+        if isinstance(actor, Addressable):
+            actor = actor.address()
+        try:
+            with Sender(actor, handshake=False) as sender:
+                sender.close_receiver()
+        except PipeException:
+            pass
+    close_receivers(inboxes)
+    if confirm is not None:
+        with ActorRef(confirm) as ref:
+            ref.closed(names=[inbox.name for inbox in inboxes])
+
+
 def spawn(actor, **kwargs):
     return actor.spawn(actor, **kwargs)
 
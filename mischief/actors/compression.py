@@ -0,0 +1,67 @@
+"""
+Compression of tcp links
+========================
+
+Senders to other hosts offer the codecs available here in the
+``__low_level_ping__`` handshake, and the receiver answers with the
+first one it also knows (or none).  After that, payloads of at least
+``COMPRESS_THRESHOLD`` bytes are compressed.
+
+A compressed frame starts with a null byte, which never starts a
+JSON text, followed by the id of the codec::
+
+    b'\\x00' + codec id + compressed JSON
+
+Links over ipc are never compressed.
+
+"""
+
+import json
+import zlib
+from collections import OrderedDict
+
+from .message import encode_default
+
+
+# Payloads smaller than this (in bytes) are sent as they are
+COMPRESS_THRESHOLD = 1024
+
+MARK = b'\x00'
+
+# name -> (id, compress, decompress), preferred first
+CODECS = OrderedDict()
+
+try:
+    import lz4.frame
+    CODECS['lz4'] = (b'\x02', lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    pass
+
+CODECS['zlib'] = (b'\x01', zlib.compress, zlib.decompress)
+
+_DECOMPRESS = dict((id_, decompress)
+                   for id_, _, decompress in CODECS.values())
+
+
+def choose_codec(offered):
+    """Pick the preferred codec of this side among ``offered``."""
+    for name in CODECS:
+        if name in (offered or ()):
+            return name
+    return None
+
+
+def encode(data, codec=None, threshold=COMPRESS_THRESHOLD):
+    """Serialize ``data``, compressing it with ``codec`` if it is large."""
+    payload = json.dumps(data, default=encode_default).encode('utf-8')
+    if codec is None or threshold is None or len(payload) < threshold:
+        return payload
+    id_, compress, _ = CODECS[codec]
+    return MARK + id_ + compress(payload)
+
+
+def decode(frame):
+    """Deserialize a frame produced by ``encode``."""
+    if frame[:1] == MARK:
+        frame = _DECOMPRESS[frame[1:2]](frame[2:])
+    return json.loads(frame.decode('utf-8'))
@@ -0,0 +1,302 @@
+"""
+Durable mailboxes
+=================
+
+A ``DurableMailbox`` logs every incoming message to an append-only
+segment log under ``ACTORS_DIRECTORY``, before queuing it.  Messages
+are acknowledged after their handler returns (see
+``Actor.receive``), and the unacknowledged ones are replayed when an
+actor with the same name creates its mailbox again, for example
+after its process crashed.  This gives at-least-once delivery.
+
+Only ``memory_limit`` messages are kept in memory.  Past that
+threshold, the mailbox keeps the position of the messages in the log
+and reads them back through ``mmap`` when they are dequeued.
+
+Enable it for an actor with a stable name::
+
+    class Worker(ProcessActor):
+        DURABLE = True
+
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import deque
+
+from .message import Message, encode_default
+from .pipe import Mailbox, ACTORS_DIRECTORY
+from ..exceptions import PipeException
+
+
+# Record header: kind, sequence number, payload length
+HEADER = struct.Struct('>BQI')
+MSG = 1
+ACK = 2
+
+
+class _Spilled(object):
+    """Position in the log of a message."""
+
+    __slots__ = ('seq', 'segment', 'offset', 'length')
+
+    def __init__(self, seq, segment, offset, length):
+        self.seq = seq
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+
+
+class DurableMailbox(Mailbox):
+    """A mailbox backed by an append-only segment log.
+
+    ``fsync`` is batched: a background thread runs it every
+    ``sync_interval`` seconds, or as soon as ``sync_every`` records
+    are waiting.  Records are flushed to the operating system on
+    each acknowledgement.
+
+    A segment is removed when it and all the older segments have no
+    unacknowledged messages, so the acknowledgements it holds are
+    never lost while they are needed.
+
+    Only one mailbox can be open on a directory at a time.
+
+    """
+
+    SEGMENT_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, name, directory=None, memory_limit=1000,
+                 sync_every=100, sync_interval=0.05, maxsize=0):
+        self.directory = directory or os.path.join(
+            ACTORS_DIRECTORY, 'mailboxes', name)
+        self.memory_limit = memory_limit
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        Mailbox.__init__(self, maxsize)
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        self._lock_directory()
+        # seq -> position of the messages not acknowledged yet
+        self.unacked = {}
+        # segment -> number of messages not acknowledged yet
+        self.live = {}
+        # existing segments, oldest first
+        self.segments = deque()
+        self.maps = {}
+        self.in_memory = 0
+        self.seq = 0
+        self.unsynced = 0
+        self.closed = False
+        self._replay()
+        self.segment = self.segments[-1] + 1 if self.segments else 0
+        self._open_segment()
+        self.sync_needed = threading.Event()
+        self.syncer = threading.Thread(target=self._syncer)
+        self.syncer.name = 'mailbox-sync-{}'.format(name)
+        self.syncer.daemon = True
+        self.syncer.start()
+
+    def _lock_directory(self):
+        self.lock_file = open(os.path.join(self.directory, 'lock'), 'w')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            self.lock_file.close()
+            raise PipeException('mailbox {} is already in use'
+                                .format(self.directory))
+
+    def _path(self, segment):
+        return os.path.join(self.directory, '{:010d}.log'.format(segment))
+
+    def _records(self, segment):
+        """Iterate over ``(kind, seq, offset, length)`` in a segment."""
+        with open(self._path(segment), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                kind, seq, length = HEADER.unpack_from(data, offset)
+                offset += HEADER.size
+                if offset + length > len(data):
+                    # truncated record from a crash in the middle of
+                    # a write
+                    break
+                yield kind, seq, offset, length
+                offset += length
+        finally:
+            data.close()
+
+    def _replay(self):
+        """Queue the messages left unacknowledged in existing segments."""
+        self.segments.extend(sorted(
+            int(f[:-4]) for f in os.listdir(self.directory)
+            if f.endswith('.log')))
+        pending = {}
+        for segment in self.segments:
+            self.live[segment] = 0
+            for kind, seq, offset, length in self._records(segment):
+                self.seq = max(self.seq, seq + 1)
+                if kind == MSG:
+                    pending[seq] = _Spilled(seq, segment, offset, length)
+                elif kind == ACK:
+                    pending.pop(seq, None)
+        for seq in sorted(pending):
+            spilled = pending[seq]
+            self.unacked[seq] = spilled
+            self.live[spilled.segment] += 1
+            self.queue.append(spilled)
+        self._drop_done_segments()
+
+    def _open_segment(self):
+        self.log = open(self._path(self.segment), 'ab')
+        self.live[self.segment] = 0
+        self.segments.append(self.segment)
+
+    def _append(self, kind, seq, payload=b''):
+        """Write a record and return the offset of its payload."""
+        if self.log.tell() >= self.SEGMENT_SIZE:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.log.close()
+            self.segment += 1
+            self._open_segment()
+            self._drop_done_segments()
+        self.log.write(HEADER.pack(kind, seq, len(payload)))
+        offset = self.log.tell()
+        self.log.write(payload)
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync_needed.set()
+        return offset
+
+    def _syncer(self):
+        """Thread function to ``fsync`` the log outside of the mutex."""
+        while not self.closed:
+            self.sync_needed.wait(self.sync_interval)
+            self.sync_needed.clear()
+            with self.mutex:
+                if self.closed or not self.unsynced:
+                    continue
+                self.log.flush()
+                fd = os.dup(self.log.fileno())
+                self.unsynced = 0
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _drop_done_segments(self, closing=False):
+        """Remove the oldest segments without pending messages."""
+        while self.segments:
+            segment = self.segments[0]
+            if self.live[segment]:
+                return
+            if segment == getattr(self, 'segment', None) and not closing:
+                return
+            self.segments.popleft()
+            del self.live[segment]
+            data = self.maps.pop(segment, None)
+            if data is not None:
+                data.close()
+            try:
+                os.remove(self._path(segment))
+            except OSError:
+                pass
+
+    def _read(self, spilled):
+        """Read a spilled message from the log."""
+        if spilled.segment == self.segment:
+            self.log.flush()
+        data = self.maps.get(spilled.segment)
+        if data is None or spilled.offset + spilled.length > len(data):
+            if data is not None:
+                data.close()
+            with open(self._path(spilled.segment), 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[spilled.segment] = data
+        payload = data[spilled.offset:spilled.offset + spilled.length]
+        msg = Message(json.loads(payload.decode('utf-8')))
+        msg.seq = spilled.seq
+        return msg
+
+    def _queue_message(self, msg, spilled):
+        """Keep ``msg`` in memory if possible, or just its position."""
+        if self.in_memory < self.memory_limit:
+            msg.seq = spilled.seq
+            self.in_memory += 1
+            self.queue.append(msg)
+        else:
+            self.queue.append(spilled)
+
+    def _put(self, item):
+        if item is None:
+            # end of stream signal from the receiver, not logged
+            self.queue.append(item)
+            return
+        seq = self.seq
+        self.seq += 1
+        payload = json.dumps(item, default=encode_default).encode('utf-8')
+        offset = self._append(MSG, seq, payload)
+        spilled = _Spilled(seq, self.segment, offset, len(payload))
+        self.unacked[seq] = spilled
+        self.live[self.segment] += 1
+        self._queue_message(item, spilled)
+
+    def _get(self):
+        item = self.queue.popleft()
+        if isinstance(item, _Spilled):
+            item = self._read(item)
+        elif item is not None:
+            self.in_memory -= 1
+        return item
+
+    def requeue(self, item):
+        """Return an item taken with ``get``, without logging it again."""
+        with self.mutex:
+            spilled = None if item is None else self.unacked.get(item.seq)
+            if spilled is None:
+                self.queue.append(item)
+            else:
+                self._queue_message(item, spilled)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def ack(self, msg):
+        """Acknowledge that ``msg`` was processed."""
+        seq = msg.seq
+        if seq is None:
+            return
+        with self.mutex:
+            if self.closed:
+                return
+            spilled = self.unacked.pop(seq, None)
+            if spilled is None:
+                return
+            self._append(ACK, seq)
+            self.log.flush()
+            self.live[spilled.segment] -= 1
+            self._drop_done_segments()
+
+    def close(self):
+        with self.mutex:
+            if self.closed:
+                return
+            self.closed = True
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.log.close()
+            for data in self.maps.values():
+                data.close()
+            self.maps.clear()
+            self._drop_done_segments(closing=not self.unacked)
+            self.lock_file.close()
+        self.sync_needed.set()
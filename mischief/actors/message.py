@@ -0,0 +1,130 @@
+"""
+Message envelope
+================
+
+Every message queued in a ``Receiver`` is wrapped in a ``Message``.
+The envelope keeps the fields used for dispatching (``tag``,
+``reply_to``, ``correlation_id`` and the ``trace`` context, see
+``mischief.actors.tracing``) in slots, and it *views* the decoded
+body instead of copying it.
+
+Handlers can keep using a message as a dict or through attributes::
+
+    def handler(self, msg):
+        msg['x'] == msg.x
+
+"""
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+class Message(MutableMapping):
+    """A compact envelope around a message body."""
+
+    __slots__ = ('tag', 'reply_to', 'correlation_id', 'trace', 'seq',
+                 'enqueued', '_body')
+
+    # Slots mirrored from keys of the body
+    ENVELOPE = ('tag', 'reply_to', 'correlation_id', 'trace')
+
+    # Slots that are not part of the body
+    LOCAL = ('seq', 'enqueued')
+
+    def __init__(self, body):
+        setattr_ = object.__setattr__
+        setattr_(self, '_body', body)
+        setattr_(self, 'tag', body.get('tag'))
+        setattr_(self, 'reply_to', body.get('reply_to'))
+        setattr_(self, 'correlation_id', body.get('correlation_id'))
+        setattr_(self, 'trace', body.get('trace'))
+        # Position in the mailbox, set by mailboxes that need
+        # acknowledgements
+        setattr_(self, 'seq', None)
+        # Arrival time in the receiver, set for traced messages
+        setattr_(self, 'enqueued', None)
+
+    def __getitem__(self, key):
+        return self._body[key]
+
+    def __setitem__(self, key, val):
+        self._body[key] = val
+        if key in self.ENVELOPE:
+            object.__setattr__(self, key, val)
+
+    def __delitem__(self, key):
+        del self._body[key]
+        if key in self.ENVELOPE:
+            object.__setattr__(self, key, None)
+
+    def __contains__(self, key):
+        return key in self._body
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def __len__(self):
+        return len(self._body)
+
+    def __getattr__(self, attr):
+        # Only called for names that are not slots, or for unset
+        # slots (for example, while unpickling)
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        try:
+            return self._body[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+    def __setattr__(self, attr, val):
+        if attr in self.LOCAL:
+            object.__setattr__(self, attr, val)
+        else:
+            self[attr] = val
+
+    def __eq__(self, other):
+        if isinstance(other, Message):
+            other = other._body
+        return self._body == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return Message, (self._body,)
+
+    def __copy__(self):
+        return Message(dict(self._body))
+
+    def __repr__(self):
+        return 'Message({!r})'.format(self._body)
+
+    def get(self, key, default=None):
+        return self._body.get(key, default)
+
+    def keys(self):
+        return self._body.keys()
+
+    def items(self):
+        return self._body.items()
+
+    def values(self):
+        return self._body.values()
+
+
+def unwrap(obj):
+    """Return the body of ``obj`` if it is a ``Message``."""
+    if isinstance(obj, Message):
+        return obj._body
+    return obj
+
+
+def encode_default(obj):
+    """``default`` hook for ``json.dumps``, to encode nested messages."""
+    if isinstance(obj, Message):
+        return obj._body
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
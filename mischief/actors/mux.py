@@ -0,0 +1,131 @@
+"""
+Multiplexed transport
+=====================
+
+With the ``'mux'`` transport (see ``pipe.TRANSPORT``), the receivers
+of a process share a single ROUTER socket, the ``MuxEndpoint`` of the
+process, instead of owning a PULL socket each.  Messages travel as
+``[actor name, payload]`` and are demultiplexed by the endpoint.
+
+Senders share one DEALER socket per endpoint they talk to (see
+``connection``), so sockets and file descriptors grow with the
+number of processes, not with the number of actors.
+
+"""
+
+import threading
+import traceback
+
+from six.moves import queue
+import zmq
+
+from ..log import setup
+from ..zmq_tools import new_socket
+
+
+logger = setup(to=['file'])
+
+
+class MuxEndpoint(object):
+    """The ROUTER socket of a process, read by its own thread.
+
+    ``dispatch(name, frame)`` is called in that thread for every
+    incoming message.
+
+    """
+
+    WAKE_ENDPOINT = 'inproc://mischief-mux'
+
+    def __init__(self, path, dispatch):
+        self.path = path
+        self.dispatch = dispatch
+        self.port = None
+        self.commands = queue.Queue()
+        self.lock = threading.Lock()
+        wake_reader = new_socket(zmq.PULL)
+        wake_reader.bind(self.WAKE_ENDPOINT)
+        self.wake = new_socket(zmq.PUSH)
+        self.wake.connect(self.WAKE_ENDPOINT)
+        router = new_socket(zmq.ROUTER)
+        router.bind('ipc://{}'.format(path))
+        self.thread = threading.Thread(target=self._run,
+                                       args=(router, wake_reader))
+        self.thread.name = 'mux'
+        self.thread.daemon = True
+        self.thread.start()
+
+    def command(self, function):
+        """Run ``function(router)`` in the thread of the endpoint."""
+        result = queue.Queue()
+        self.commands.put((function, result))
+        with self.lock:
+            self.wake.send(b'')
+        ok, value = result.get()
+        if not ok:
+            raise value
+        return value
+
+    def export(self, bind_port):
+        """Bind the ROUTER to a tcp port with ``bind_port``, once."""
+        if self.port is None:
+            self.command(lambda router: self._bind(router, bind_port))
+        return self.port
+
+    def _bind(self, router, bind_port):
+        if self.port is None:
+            self.port = bind_port(router)
+
+    def _run(self, router, wake_reader):
+        poller = zmq.Poller()
+        poller.register(router, zmq.POLLIN)
+        poller.register(wake_reader, zmq.POLLIN)
+        while True:
+            for s, _ in poller.poll():
+                if s is wake_reader:
+                    wake_reader.recv()
+                    self._run_commands(router)
+                    continue
+                frames = router.recv_multipart()
+                if len(frames) != 3:
+                    continue
+                try:
+                    self.dispatch(frames[1].decode('utf-8'), frames[2])
+                except Exception:
+                    logger.debug('mux endpoint got an exception:')
+                    logger.debug(traceback.format_exc())
+
+    def _run_commands(self, router):
+        while not self.commands.empty():
+            function, result = self.commands.get()
+            try:
+                result.put((True, function(router)))
+            except Exception as exc:
+                result.put((False, exc))
+
+
+class Connection(object):
+    """A DEALER socket to an endpoint, shared by the senders of the
+    process."""
+
+    def __init__(self, url):
+        self.url = url
+        self.lock = threading.Lock()
+        self.socket = new_socket(zmq.DEALER)
+        self.socket.connect(url)
+
+    def send(self, name, frame):
+        with self.lock:
+            self.socket.send_multipart([name.encode('utf-8'), frame])
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def connection(url):
+    """Return the connection of this process to the endpoint at ``url``."""
+    with _connections_lock:
+        conn = _connections.get(url)
+        if conn is None:
+            conn = _connections[url] = Connection(url)
+        return conn
@@ -107,6 +107,10 @@ class NameBroker(Server):
         except KeyError:
             pass
 
+    def unregister_many(self, data):
+        for name in data['__names__']:
+            self.names.pop(name, None)
+
     def list(self, data):
         return self.names
 
@@ -149,6 +153,11 @@ class NameBrokerClient(object):
                   {'__tag__': 'unregister',
                    '__name__': name})
 
+    def unregister_many(self, names):
+        self.send(self.addr,
+                  {'__tag__': 'unregister_many',
+                   '__names__': list(names)})
+
     def list(self):
         names = self.send(self.addr,
                           {'__tag__': 'list'})
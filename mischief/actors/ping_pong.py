@@ -10,11 +10,10 @@ ActorKind = ProcessActor
 class Ticker(ActorKind):
 
     def act(self):
-        while True:
-            self.receive(
-                set_start_time=self.set_start_time,
-                tick=self.tick,
-            )
+        self.receive_loop(self.compile_patterns(
+            set_start_time=self.set_start_time,
+            tick=self.tick,
+        ))
 
     def set_start_time(self, msg):
         self.starting_time = time.time()
@@ -1,6 +1,10 @@
+import copy
 import errno
+import json
+import logging
 import os
 import threading
+import time
 import traceback
 import socket
 import inspect
@@ -12,16 +16,22 @@ Empty = queue.Empty
 
 
 import zmq
+from . import compression, mux
 from .namebroker import NameBrokerClient
+from .ports import PortAllocator
+from .message import Message, encode_default, unwrap
 from ..log import setup, show_msg
-from ..zmq_tools import zmq_socket, Context
+from ..zmq_tools import zmq_socket, new_socket
 from ..exceptions import PipeException, PipeEmpty
+from ..tools import Addressable
 
 
 logger = setup(to=['file'])
 
-MIN_PORT = 50000
-MAX_PORT = 60000
+# Range of the tcp ports of receivers, handed out by a
+# ``PortAllocator`` shared by the processes of the host
+MIN_PORT = int(os.environ.get('MISCHIEF_MIN_PORT', 50000))
+MAX_PORT = int(os.environ.get('MISCHIEF_MAX_PORT', 60000))
 
 ACTORS_DIRECTORY = '/tmp/actors_{}'.format(os.environ.get('USER', 'NO_USER'))
 try:
@@ -32,17 +42,37 @@ except OSError as exc:
     if exc.errno != errno.EEXIST:
         raise
 
-# Set some time to wait for sockets to deliver messages
-# We don't want infinite time, since it may block when exiting
-# the application
-Context.linger = 5000  # ms
-
-
 def path_to(name):
     """Path for posix ipc socket with name ``name``."""
     return os.path.join(ACTORS_DIRECTORY, name)
 
 
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def port_allocator():
+    """Return the allocator for the current port range."""
+    key = MIN_PORT, MAX_PORT
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None:
+            allocator = _allocators[key] = PortAllocator(
+                path_to('ports-{}-{}'.format(*key)), *key)
+        return allocator
+
+
+def bind_port(socket):
+    """Bind ``socket`` to a free tcp port and return it."""
+    return port_allocator().bind(socket)
+
+
+def release_port(port):
+    """Release a port bound with ``bind_port`` after closing its socket."""
+    if isinstance(port, int):
+        port_allocator().release(port)
+
+
 def get_local_ip(target):
     """Get the *local* ip.
 
@@ -66,6 +96,63 @@ def get_local_ip(target):
     return ipaddr
 
 
+# Receivers living in this process, by name
+_receivers = {}
+
+# Default transport of the receivers:
+#
+# * ``'zmq'``: a PULL socket per receiver
+# * ``'mux'``: the receivers of the process share a ROUTER socket
+#   (see ``mischief.actors.mux``)
+TRANSPORT = os.environ.get('MISCHIEF_TRANSPORT', 'zmq')
+
+# Ports of receivers using the mux transport are the tcp port of the
+# endpoint of their process, with this prefix
+MUX_PREFIX = 'mux:'
+
+_mux_endpoint = None
+_mux_lock = threading.Lock()
+
+
+def mux_endpoint():
+    """Return the ``MuxEndpoint`` of this process, creating it if needed."""
+    global _mux_endpoint
+    with _mux_lock:
+        if _mux_endpoint is None:
+            _mux_endpoint = mux.MuxEndpoint(
+                path_to('mux-{}'.format(os.getpid())), _mux_dispatch)
+        return _mux_endpoint
+
+
+def _mux_dispatch(name, frame):
+    receiver = _receivers.get(name)
+    if receiver is None or receiver.transport != 'mux':
+        logger.debug('mux: no receiver {}'.format(name))
+        return
+    if not receiver.handle(compression.decode(frame)):
+        receiver._finish()
+
+# How senders copy messages delivered to a receiver in the same
+# process:
+#
+# * ``'json'``: encode and decode the message, as the sockets do
+# * ``'deepcopy'``: a deep copy of the message
+# * ``None``: share the message (the sender must not modify it
+#   after sending it)
+LOCAL_COPY = 'json'
+
+
+def local_receiver(address):
+    """Return the receiver for ``address`` if it lives in this process."""
+    name, ip, port = address
+    receiver = _receivers.get(name)
+    if (receiver is None or receiver.closed or
+            (port is not None and port != receiver.port) or
+            not is_local_ip(ip)):
+        return None
+    return receiver
+
+
 def is_local_ip(target):
     """Check that ``target`` is a local ip."""
     if target in (None, 'localhost', '127.0.0.1'):
@@ -73,6 +160,107 @@ def is_local_ip(target):
     return target == get_local_ip(target)
 
 
+class Mailbox(Queue):
+    """The queue where a ``Receiver`` puts the incoming messages."""
+
+    def requeue(self, item):
+        """Return an item taken with ``get`` to the mailbox."""
+        self.put(item)
+
+    def ack(self, msg):
+        """Acknowledge that ``msg`` was processed."""
+
+    def close(self):
+        """Release the resources of the mailbox."""
+
+
+class _Slot(object):
+    """A position in a ``ConflatingMailbox`` shared by a conflation key."""
+
+    __slots__ = ('key', 'item')
+
+    def __init__(self, key, item):
+        self.key = key
+        self.item = item
+
+
+class ConflatingMailbox(Mailbox):
+    """A mailbox keeping only the newest unprocessed message per key.
+
+    ``conflate`` maps tags to the name of a field of the message, or
+    to ``None``.  A message with one of those tags replaces, in place,
+    a pending message with the same tag (and the same value of the
+    field, if given).  Other messages are queued as usual.
+
+    For example::
+
+        ConflatingMailbox({'progress': None, 'position': 'id'})
+
+    keeps only the last ``progress`` message, and the last
+    ``position`` message for each ``id``.
+
+    """
+
+    def __init__(self, conflate, maxsize=0):
+        self.conflate = dict(conflate)
+        Mailbox.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        Mailbox._init(self, maxsize)
+        self.pending = {}
+
+    def _key(self, item):
+        try:
+            tag = item.tag
+        except AttributeError:
+            return None
+        try:
+            field = self.conflate[tag]
+        except (KeyError, TypeError):
+            return None
+        if field is None:
+            return (tag,)
+        key = (tag, item.get(field))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _put(self, item):
+        key = self._key(item)
+        if key is None:
+            self.queue.append(item)
+            return
+        slot = self.pending.get(key)
+        if slot is not None:
+            slot.item = item
+        else:
+            slot = self.pending[key] = _Slot(key, item)
+            self.queue.append(slot)
+
+    def _get(self):
+        item = self.queue.popleft()
+        if isinstance(item, _Slot):
+            del self.pending[item.key]
+            return item.item
+        return item
+
+    def requeue(self, item):
+        """Return an item taken with ``get`` to the mailbox.
+
+        The item is dropped if a newer message with the same key
+        arrived in the meantime.
+
+        """
+        with self.mutex:
+            if self._key(item) in self.pending:
+                return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
 class Receiver(object):
     """A receiver end of a pipe.
 
@@ -97,124 +285,287 @@ class Receiver(object):
 
         {'tag': '__pong__'}
 
+    Incoming messages are queued in ``mailbox`` (a new ``Mailbox`` by
+    default).
+
+    ``transport`` is ``'zmq'`` or ``'mux'`` (see ``TRANSPORT``).
+
+    With ``use_remote``, the receiver binds a tcp port and registers
+    its name in the namebroker only when its address is first
+    exported to another host (see ``export``), so that receivers only
+    used in this host stay cheap.  A receiver that must not ignore the
+    namebroker binds and registers when it is created, to report
+    errors at once.
+
     Receiver requires the dependencies: NameBrokerClient and Sender.
 
     """
     def __init__(self, name, ip='localhost', use_remote=True,
-                 ignore_namebroker=True):
+                 ignore_namebroker=True, mailbox=None, transport=None):
         self.name = name
         self.ip = ip
         self.use_remote = use_remote
         self.ignore_namebroker = ignore_namebroker
+        self.transport = transport or TRANSPORT
 
         self.path = path_to(name)
 
         self.namebroker_client = NameBrokerClient(at=self.ip)
 
-        self.reader_queue = Queue()
-        socket = self.setup_reader()
-        self.reader_thread = threading.Thread(target=self._reader,
-                                              args=(logger, socket))
-        self.reader_thread.name = 'receiver-{}'.format(self.name)
-        self.reader_thread.daemon = True
-        self.reader_thread.start()
+        self.reader_queue = mailbox if mailbox is not None else Mailbox()
+        self.closed = False
+        self.registered = False
+        self.export_lock = threading.Lock()
+        self.exported = threading.Event()
+        self.finished = threading.Event()
+        if self.transport == 'mux':
+            self.socket = self.reader_thread = None
+            self.setup_mux()
+        else:
+            self.socket = self.setup_reader()
+            self.reader_thread = threading.Thread(
+                target=self._reader, args=(logger, self.socket))
+            self.reader_thread.name = 'receiver-{}'.format(self.name)
+            self.reader_thread.daemon = True
+            self.reader_thread.start()
+        _receivers[self.name] = self
         logger.debug('Receiver {} created'.format(self.name))
 
     def address(self):
         return self.name, self.ip, self.port
 
+    def export(self, timeout=1):
+        """
+        Bind the tcp port and register the name, if not done yet.
+
+        Return the address, with the port ``None`` if the receiver is
+        only reachable through ipc.
+        """
+        if self.port is not None or not self.use_remote or self.closed:
+            return self.address()
+        if self.transport == 'mux':
+            self._export(None)
+            return self.address()
+        if threading.current_thread() is self.reader_thread:
+            self._export(self.socket)
+            return self.address()
+        with self.export_lock:
+            if self.port is None:
+                # the socket belongs to the reader thread: ask it
+                with zmq_socket(zmq.PUSH) as s:
+                    s.connect('ipc://{}'.format(self.path))
+                    s.send_json({'tag': '__export__'})
+                self.exported.wait(timeout)
+        return self.address()
+
+    def _export(self, socket):
+        """Bind ``socket`` to a tcp port and register it."""
+        if self.port is None:
+            if self.transport == 'mux':
+                self.port = '{}{}'.format(
+                    MUX_PREFIX, mux_endpoint().export(bind_port))
+            else:
+                self.port = bind_port(socket)
+            try:
+                self.namebroker_client.register(self.name, self.port)
+                self.registered = True
+            except PipeException:
+                if not self.ignore_namebroker:
+                    raise
+        self.exported.set()
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
-        self.reader_thread.join()
+        self.wait_closed()
+
+    def wait_closed(self, timeout=None):
+        """Wait until the receiver released its name after a close."""
+        if self.reader_thread is not None:
+            self.reader_thread.join(timeout)
+        else:
+            self.finished.wait(timeout)
 
     def _reader(self, logger, socket):
         try:
             self._reader_loop(socket)
             logger.debug('  ..._reader_loop exited')
         finally:
-            socket.close()
+            self._finish(socket)
             logger.debug('  ...closed Sender socket after reader loop exit')
 
+    def _finish(self, socket=None):
+        """Release the resources of the receiver once it is closed."""
+        self.closed = True
+        if _receivers.get(self.name) is self:
+            del _receivers[self.name]
+            self.unsubscribe()
+            if self.transport == 'mux':
+                self._unlink_mux()
+        if socket is not None:
+            socket.close()
+        release_port(self.port)
+        self.reader_queue.close()
+        self.finished.set()
+
     def _reader_loop(self, socket):
         """
         Thread function that reads the zmq socket and puts the data
         into the queue
         """
-        queue = self.reader_queue
         while True:
             try:
-                data = socket.recv_json()
-                __tag__ = data.get('tag')
-                if __tag__ == '__quit__':
-                    # means to shutdown the thread
-                    # Close the socket just so the confirmation message
-                    # goes after the socket is closed.  The 'with'
-                    # statement of _reader would close it anyways.
-                    socket.close()
-                    # Put None in the queue to signal clients that are
-                    # waiting for data
-                    queue.put(None)
-                    confirm_to = data.get('confirm_to', None)
-                    if confirm_to is not None:
-                        # Confirm that the socket was closed
-                        with Sender(confirm_to) as sender:
-                            confirm_msg = data.get('confirm_msg', None)
-                            sender.put(confirm_msg)
-                    self.namebroker_client.unregister(self.name)
+                if not self.handle(compression.decode(socket.recv()),
+                                   socket):
                     return
-                if __tag__ == '__ping__':
-                    # answer special message without going to the receive,
-                    # since the actor may be doing something long lasting
-                    # and not reading the queue
-                    with Sender(data['reply_to']) as sender:
-                        sender.put({'tag': '__pong__'})
-                    # avoid inserting this message in the queue
-                    continue
-                if __tag__ == '__address__':
-                    # Fill the port info for my address
-                    with Sender(data['reply_to']) as sender:
-                        sender.put({'tag': 'reply',
-                                    'address': self.address(),
-                                    'pid': os.getpid()})
-                    continue
-                if __tag__ == '__low_level_ping__':
-                    # answer a ping from a straight zmq socket
-                    sender = data['reply_to']
-                    with zmq_socket(zmq.PUSH) as s:
-                        s.connect(sender)
-                        s.send_json({'tag': '__pong__'})
-                    continue
             except Exception:
                 exc = traceback.format_exc()
                 logger.debug('Reader thread for {} got an exception:'
                              .format(self.path))
                 logger.debug(exc)
                 return
-            queue.put(data)
+
+    def handle(self, data, socket=None):
+        """
+        Handle a message read from the transport.  Return ``False``
+        when the receiver must stop.
+        """
+        __tag__ = data.get('tag')
+        if __tag__ == '__quit__':
+            # means to shutdown the thread
+            self.closed = True
+            if socket is not None:
+                # Close the socket just so the confirmation message
+                # goes after the socket is closed.  The 'with'
+                # statement of _reader would close it anyways.
+                socket.close()
+            # Put None in the queue to signal clients that are
+            # waiting for data
+            self.reader_queue.put(None)
+            confirm_to = data.get('confirm_to', None)
+            if confirm_to is not None:
+                # Confirm that the socket was closed
+                with Sender(confirm_to) as sender:
+                    confirm_msg = data.get('confirm_msg', None)
+                    sender.put(confirm_msg)
+            if self.registered and data.get('unregister', True):
+                self.namebroker_client.unregister(self.name)
+            return False
+        if __tag__ == '__export__':
+            self._export(socket)
+        elif __tag__ == '__low_level_ping__':
+            # answer a ping from a straight zmq socket
+            sender = data['reply_to']
+            pong = {'tag': '__pong__'}
+            if 'compression' in data:
+                pong['compression'] = compression.choose_codec(
+                    data['compression'])
+            with zmq_socket(zmq.PUSH) as s:
+                s.connect(sender)
+                s.send_json(pong)
+        else:
+            self.deliver(data)
+        return True
+
+    def deliver(self, data):
+        """
+        Put a decoded message in the mailbox, or answer it if it is
+        a control message.
+
+        This is used by the reader thread, and by the senders in the
+        same process, which skip the socket.
+
+        """
+        if self.closed:
+            return
+        __tag__ = data.get('tag')
+        if __tag__ == '__ping__':
+            # answer special message without going to the receive,
+            # since the actor may be doing something long lasting
+            # and not reading the queue
+            with Sender(data['reply_to']) as sender:
+                sender.put({'tag': '__pong__'})
+            # avoid inserting this message in the queue
+            return
+        if __tag__ == '__address__':
+            # Fill the port info for my address
+            with Sender(data['reply_to']) as sender:
+                address = (self.address() if sender.local
+                           else self.export())
+                sender.put({'tag': 'reply',
+                            'address': address,
+                            'pid': os.getpid()})
+            return
+        msg = Message(data)
+        if msg.trace is not None:
+            msg.enqueued = time.time()
+        self.reader_queue.put(msg)
+
+    def setup_mux(self):
+        """Make the name point to the endpoint of the process."""
+        self.port = None
+        endpoint = mux_endpoint()
+        if os.name == 'posix':
+            # local senders find the endpoint through the link
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            os.symlink(endpoint.path, self.path)
+        if os.name != 'posix' or (self.use_remote and
+                                  not self.ignore_namebroker):
+            self.use_remote = True
+            self._export(None)
+
+    def _unlink_mux(self):
+        try:
+            if os.readlink(self.path) == mux_endpoint().path:
+                os.unlink(self.path)
+        except OSError:
+            pass
 
     def setup_reader(self):
         """Create the socket for the reader and bind it."""
-        s = Context.socket(zmq.PULL)
+        s = new_socket(zmq.PULL)
+        self.port = None
         if os.name == 'posix':
             s.bind('ipc://{}'.format(self.path))
-        if self.use_remote or os.name != 'posix':
-            self.port = s.bind_to_random_port(
-                'tcp://*', min_port=MIN_PORT, max_port=MAX_PORT)
-            try:
-                self.namebroker_client.register(self.name, self.port)
-            except PipeException:
-                if not self.ignore_namebroker:
-                    raise
-        else:
-            self.port = None
+        if os.name != 'posix' or (self.use_remote and
+                                  not self.ignore_namebroker):
+            self.use_remote = True
+            self._export(s)
         return s
 
     def qsize(self):
         return self.reader_queue.qsize()
 
+    def ack(self, data):
+        """Acknowledge that ``data`` was processed."""
+        self.reader_queue.ack(data)
+
+    def subscribe(self, publisher, topics):
+        """Deliver to this receiver the messages of ``publisher`` in
+        ``topics`` (see ``Publisher``)."""
+        subscription_hub().command(
+            'subscribe', self.name, publisher_endpoint(publisher),
+            list(topics))
+
+    def unsubscribe(self, publisher=None, topics=None):
+        """Cancel subscriptions to ``topics`` of ``publisher`` (all of
+        them by default)."""
+        if _hub is None:
+            return
+        endpoint = (publisher_endpoint(publisher)
+                    if publisher is not None else None)
+        _hub.command('unsubscribe', self.name, endpoint,
+                     list(topics) if topics is not None else None)
+
+    def unread(self, data):
+        """Return ``data``, taken with ``read``, to the mailbox."""
+        self.reader_queue.requeue(data)
+
     def read(self, block=True, timeout=None):
         try:
             x = self.reader_queue.get(block, timeout)
@@ -224,15 +575,75 @@ class Receiver(object):
         except Empty:
             raise PipeEmpty()
 
-    def close(self, confirm_to=None, confirm_msg=None):
-        with Sender(self.address()) as sender:
-            sender.close_receiver(confirm_to, confirm_msg)
+    def close(self, confirm_to=None, confirm_msg=None, unregister=True):
+        """
+        Stop the receiver, without waiting for it (see
+        ``wait_closed``).  Closing a closed receiver does nothing.
+        """
+        if self.closed:
+            return
+        msg = quit_message(confirm_to, confirm_msg, unregister)
+        if self.transport == 'mux':
+            if not self.handle(msg):
+                self._finish()
+        else:
+            # signal the reader thread through its own socket, without
+            # the handshake of a full sender
+            with Sender(self.address(), handshake=False) as sender:
+                sender.put(msg)
         logger.debug('Receiver {} destroyed'.format(self.name))
 
     # synonym
     get = read
 
 
+def quit_message(confirm_to=None, confirm_msg=None, unregister=True):
+    """The message that closes a receiver."""
+    msg = {'tag': '__quit__',
+           'confirm_to': confirm_to,
+           'confirm_msg': confirm_msg}
+    if not unregister:
+        msg['unregister'] = False
+    return msg
+
+
+def close_receivers(receivers, timeout=None):
+    """
+    Close receivers of this process, and wait for them.
+
+    Their names are unregistered from the namebroker with one request
+    per namebroker, instead of one per receiver.
+    """
+    for receiver in receivers:
+        receiver.close(unregister=False)
+    registered = {}
+    for receiver in receivers:
+        receiver.wait_closed(timeout)
+        if receiver.registered:
+            registered.setdefault(receiver.ip, []).append(receiver.name)
+    for ip, names in registered.items():
+        try:
+            NameBrokerClient(at=ip).unregister_many(names)
+        except PipeException:
+            logger.debug('could not unregister {} names at {}'
+                         .format(len(names), ip))
+
+
+def export_addresses(msg):
+    """
+    Export the receivers of this process whose addresses are in the
+    ``reply_to`` or ``confirm_to`` fields of ``msg``, to send it to
+    another host.
+    """
+    for key in ('reply_to', 'confirm_to'):
+        address = msg.get(key)
+        if (isinstance(address, (tuple, list)) and len(address) == 3 and
+                address[2] is None):
+            receiver = local_receiver(address)
+            if receiver is not None:
+                msg[key] = (address[0], address[1], receiver.export()[2])
+
+
 def get_port_for(name, at):
     """Consult namebroker for the port associated to a name."""
     resp = NameBrokerClient.send(at, {'__tag__': 'get',
@@ -264,15 +675,61 @@ class Sender(object):
     If the port is not known, get it from the ``NameBroker``
     objects.
 
+    If the receiver lives in the same process, messages are put
+    directly in its mailbox, copied according to ``local_copy`` (see
+    ``LOCAL_COPY``).
+
+    Over tcp, messages of at least ``compress_threshold`` bytes are
+    compressed, if both ends agree on a codec (see
+    ``mischief.actors.compression``).  Use ``None`` to disable it.
+
+    Without ``handshake``, the sender does not check that the receiver
+    is answering, and it never compresses.
+
     """
 
-    def __init__(self, address, use_local=True):
+    def __init__(self, address, use_local=True, local_copy=LOCAL_COPY,
+                 compress_threshold=compression.COMPRESS_THRESHOLD,
+                 handshake=True):
         self.set_debug_name()
         self.name, self.ip, self.port = self.address = address
         self.local = (use_local and is_local_ip(self.ip)
                       if os.name == 'posix' else False)
-        self.socket = Context.socket(zmq.PUSH)
+        self.local_copy = local_copy
+        self.compress_threshold = compress_threshold
+        # codec agreed with the receiver
+        self.codec = None
+        self.socket = None
+        # shared connection, for receivers using the mux transport
+        self.mux = None
+        self.receiver = local_receiver(self.address)
+        if self.receiver is not None:
+            logger.debug('  ...sender {} is in the same process'
+                         .format(self.name))
+        else:
+            self._connect()
+            if handshake and not self.__ping__():
+                msg = ('Receiver ipc://{self.name} is not answering'
+                       if self.local else
+                       ('Receiver tcp://{self.ip}:{self.port} '
+                        '(name "{self.name}") is not answering'))
+                raise PipeException(msg.format(self=self))
+        logger.debug('Sender {} created (in {})'
+                     .format(self.name, self.my_actor))
 
+    def _connect(self):
+        if (self.port is None and not self.local and os.name == 'posix'
+                and is_local_ip(self.ip)):
+            # a receiver that was not exported has only its ipc socket
+            self.local = True
+        elif self.port is None and not self.local:
+            self.port = get_port_for(self.name, self.ip)
+        url = self._mux_url()
+        if url is not None:
+            logger.debug('  ...sender {} is using {}'.format(self.name, url))
+            self.mux = mux.connection(url)
+            return
+        self.socket = new_socket(zmq.PUSH)
         if self.local:
             self.path = path_to(self.name)
             logger.debug('  ...sender {} is using ipc'.format(self.name))
@@ -283,14 +740,23 @@ class Sender(object):
             self.socket.connect('tcp://{self.ip}:{self.port}'
                                 .format(self=self))
 
-        if not self.__ping__():
-            msg = ('Receiver ipc://{self.name} is not answering'
-                   if self.local else
-                   ('Receiver tcp://{self.ip}:{self.port} '
-                    '(name "{self.name}") is not answering'))
-            raise PipeException(msg.format(self=self))
-        logger.debug('Sender {} created (in {})'
-                     .format(self.name, self.my_actor))
+    def _mux_url(self):
+        """The endpoint of the receiver, if it uses the mux transport."""
+        if self.local:
+            try:
+                return 'ipc://{}'.format(os.readlink(path_to(self.name)))
+            except OSError:
+                return None
+        port = str(self.port)
+        if port.startswith(MUX_PREFIX):
+            return 'tcp://{}:{}'.format(self.ip, port[len(MUX_PREFIX):])
+        return None
+
+    def _send(self, frame):
+        if self.mux is not None:
+            self.mux.send(self.name, frame)
+        else:
+            self.socket.send(frame)
 
     def set_debug_name(self):
         """Name for debugging purposes.
@@ -312,10 +778,9 @@ class Sender(object):
             recv_socket.bind(addr)
             return addr
         else:
-            port = recv_socket.bind_to_random_port(
-                'tcp://*', min_port=MIN_PORT, max_port=MAX_PORT)
+            self.temp_port = bind_port(recv_socket)
             ip = get_local_ip(self.ip)
-            return 'tcp://{}:{}'.format(ip, port)
+            return 'tcp://{}:{}'.format(ip, self.temp_port)
 
     def __ping__(self):
         """Low level ping.
@@ -323,16 +788,23 @@ class Sender(object):
         Check the reader loop of the receiver is running.
 
         """
-        with zmq_socket(zmq.PULL) as r:
-            address = self._temp_receiver(r)
-            self.socket.send_json({'tag': '__low_level_ping__',
-                                   'reply_to': address})
-            try:
-                r.set(zmq.RCVTIMEO, 1000)
-                resp = r.recv_json()
-                return resp['tag'] == '__pong__'
-            except zmq.Again:
-                return False
+        ping = {'tag': '__low_level_ping__'}
+        if not self.local and self.compress_threshold is not None:
+            ping['compression'] = list(compression.CODECS)
+        self.temp_port = None
+        try:
+            with zmq_socket(zmq.PULL) as r:
+                ping['reply_to'] = self._temp_receiver(r)
+                self._send(compression.encode(ping))
+                try:
+                    r.set(zmq.RCVTIMEO, 1000)
+                    resp = r.recv_json()
+                except zmq.Again:
+                    return False
+        finally:
+            release_port(self.temp_port)
+        self.codec = resp.get('compression')
+        return resp['tag'] == '__pong__'
 
     def __enter__(self):
         return self
@@ -341,22 +813,234 @@ class Sender(object):
         self.close()
 
     def write(self, data):
-        logger.debug('From {} to {}:\n{}'.
-                     format(self.my_actor, self.name,
-                            show_msg(data, indent=4)))
-        self.socket.send_json(data)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('From {} to {}:\n{}'.
+                         format(self.my_actor, self.name,
+                                show_msg(data, indent=4)))
+        receiver = self.receiver
+        if receiver is not None and receiver.closed:
+            # the receiver was closed: look for a new one with the
+            # same name, or use the socket
+            receiver = self.receiver = local_receiver(self.address)
+        if (receiver is not None and isinstance(data, (dict, Message)) and
+                data.get('tag') != '__quit__'):
+            receiver.deliver(self._copy(data))
+            return
+        if self.socket is None and self.mux is None:
+            self._connect()
+        if not self.local:
+            export_addresses(data)
+        self._send(compression.encode(data, self.codec,
+                                      self.compress_threshold))
+
+    def _copy(self, data):
+        """Copy a message delivered in the same process."""
+        if self.local_copy == 'json':
+            return json.loads(json.dumps(data, default=encode_default))
+        if self.local_copy == 'deepcopy':
+            data = copy.deepcopy(data)
+        return unwrap(data)
 
     def close(self):
-        self.socket.close()
+        if self.socket is not None:
+            self.socket.close()
         logger.debug('Sender {} destroyed'.format(self.name))
 
-    def close_receiver(self, confirm_to=None, confirm_msg=None):
-        self.put({'tag': '__quit__',
-                  'confirm_to': confirm_to,
-                  'confirm_msg': confirm_msg})
+    def close_receiver(self, confirm_to=None, confirm_msg=None,
+                       unregister=True):
+        self.put(quit_message(confirm_to, confirm_msg, unregister))
 
     # synonym
     put = write
 
     def __del__(self):
         self.close()
+
+
+class Publisher(Addressable):
+    """The publishing end of topics.
+
+    Use as::
+
+        with Publisher('prices') as pub:
+            pub.publish('eur', value=1.1)
+
+    A message is serialized once, whatever the number of
+    subscribers, and the subscriptions are filtered at the publisher:
+    topics nobody subscribed to are not sent.  The ``tag`` of a
+    message defaults to its topic.
+
+    Subscribe with ``Receiver.subscribe`` (or ``Actor.subscribe``)
+    using the address of the publisher.  Topics match by prefix, as
+    in zmq: subscribing to ``'eur'`` also receives ``'eur.usd'``.
+
+    A publisher must be used from only one thread.
+
+    """
+
+    def __init__(self, name, ip='localhost', use_remote=True):
+        self.name = name
+        self.ip = ip
+        self.path = path_to('{}.pub'.format(name))
+        self.socket = new_socket(zmq.PUB)
+        if os.name == 'posix':
+            self.socket.bind('ipc://{}'.format(self.path))
+        if use_remote or os.name != 'posix':
+            self.port = bind_port(self.socket)
+        else:
+            self.port = None
+        logger.debug('Publisher {} created'.format(self.name))
+
+    def address(self):
+        return self.name, self.ip, self.port
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def publish(self, topic, msg=None, **fields):
+        """Publish ``msg``, updated with ``fields``, in ``topic``."""
+        msg = dict(msg or {}, **fields)
+        msg.setdefault('tag', topic)
+        self.socket.send_multipart(
+            [topic.encode('utf-8'),
+             json.dumps(msg, default=encode_default).encode('utf-8')])
+
+    def close(self):
+        self.socket.close()
+        release_port(self.port)
+        logger.debug('Publisher {} destroyed'.format(self.name))
+
+
+def publisher_endpoint(address):
+    """The zmq endpoint to subscribe to the publisher at ``address``."""
+    if isinstance(address, Addressable):
+        address = address.address()
+    name, ip, port = address
+    if os.name == 'posix' and (port is None or is_local_ip(ip)):
+        return 'ipc://{}'.format(path_to('{}.pub'.format(name)))
+    return 'tcp://{}:{}'.format(ip, port)
+
+
+class _SubscriptionHub(object):
+    """Thread reading the subscriptions of all receivers in the process.
+
+    There is one SUB socket per publisher, shared by all the
+    receivers subscribed to it.  The messages are delivered to the
+    mailboxes of the receivers subscribed to a prefix of the topic.
+
+    Other threads send commands through ``commands``, and wake up
+    the hub with a message in an inproc socket.
+
+    """
+
+    WAKE_ENDPOINT = 'inproc://mischief-subscriptions'
+
+    def __init__(self):
+        self.commands = Queue()
+        self.lock = threading.Lock()
+        wake_reader = new_socket(zmq.PULL)
+        wake_reader.bind(self.WAKE_ENDPOINT)
+        self.wake = new_socket(zmq.PUSH)
+        self.wake.connect(self.WAKE_ENDPOINT)
+        # endpoint -> SUB socket
+        self.sockets = {}
+        # endpoint -> {topic: set of receiver names}
+        self.topics = {}
+        self.thread = threading.Thread(target=self._run,
+                                       args=(wake_reader,))
+        self.thread.name = 'subscriptions'
+        self.thread.daemon = True
+        self.thread.start()
+
+    def command(self, *cmd):
+        """Run a command in the hub thread and wait for it."""
+        done = threading.Event()
+        self.commands.put(cmd + (done,))
+        with self.lock:
+            self.wake.send(b'')
+        done.wait()
+
+    def _run(self, wake_reader):
+        poller = zmq.Poller()
+        poller.register(wake_reader, zmq.POLLIN)
+        while True:
+            for s, _ in poller.poll():
+                if s is wake_reader:
+                    wake_reader.recv()
+                    while not self.commands.empty():
+                        cmd = self.commands.get()
+                        try:
+                            getattr(self, '_' + cmd[0])(poller, *cmd[1:-1])
+                        except Exception:
+                            logger.debug(traceback.format_exc())
+                        finally:
+                            cmd[-1].set()
+                else:
+                    self._dispatch(s)
+
+    def _subscribe(self, poller, name, endpoint, topics):
+        s = self.sockets.get(endpoint)
+        if s is None:
+            s = self.sockets[endpoint] = new_socket(zmq.SUB)
+            s.connect(endpoint)
+            poller.register(s, zmq.POLLIN)
+            self.topics[endpoint] = {}
+        subscribed = self.topics[endpoint]
+        for topic in topics:
+            if topic not in subscribed:
+                subscribed[topic] = set()
+                s.setsockopt(zmq.SUBSCRIBE, topic.encode('utf-8'))
+            subscribed[topic].add(name)
+
+    def _unsubscribe(self, poller, name, endpoint, topics):
+        endpoints = [endpoint] if endpoint is not None else list(self.topics)
+        for endpoint in endpoints:
+            subscribed = self.topics.get(endpoint, {})
+            for topic in (topics if topics is not None else
+                          list(subscribed)):
+                names = subscribed.get(topic)
+                if names is None:
+                    continue
+                names.discard(name)
+                if not names:
+                    del subscribed[topic]
+                    self.sockets[endpoint].setsockopt(
+                        zmq.UNSUBSCRIBE, topic.encode('utf-8'))
+            if endpoint in self.sockets and not subscribed:
+                s = self.sockets.pop(endpoint)
+                del self.topics[endpoint]
+                poller.unregister(s)
+                s.close()
+
+    def _dispatch(self, s):
+        topic, payload = s.recv_multipart()
+        topic = topic.decode('utf-8')
+        payload = payload.decode('utf-8')
+        for endpoint, subscribed in self.topics.items():
+            if self.sockets[endpoint] is s:
+                break
+        names = set()
+        for prefix, subscribers in subscribed.items():
+            if topic.startswith(prefix):
+                names.update(subscribers)
+        for name in names:
+            receiver = _receivers.get(name)
+            if receiver is not None:
+                # each receiver gets its own copy of the message
+                receiver.deliver(json.loads(payload))
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def subscription_hub():
+    """Return the subscription hub of the process, starting it if needed."""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = _SubscriptionHub()
+        return _hub
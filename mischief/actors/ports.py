@@ -0,0 +1,119 @@
+"""
+Port allocation
+===============
+
+Receivers bind their tcp ports through a ``PortAllocator`` shared by
+all the processes of the host, instead of probing random ports.
+
+The allocator is a file with one slot per port of the range, holding
+the pid of the process that owns the port (or 0), and a cursor.  The
+file is mapped in memory and locked with ``flock`` while in use.
+Ports are handed out next-fit from the cursor, so finding a free
+port does not depend on how many ports are taken.  Ports are
+released when their sockets are closed, and the ports of dead
+processes are taken back when the cursor reaches them.
+
+"""
+
+import errno
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+import zmq
+
+from ..exceptions import PipeException
+
+
+SLOT = struct.Struct('<I')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno == errno.EPERM
+    return True
+
+
+class PortAllocator(object):
+    """Allocate tcp ports in ``[min_port, max_port)`` for this host."""
+
+    def __init__(self, path, min_port, max_port):
+        self.path = path
+        self.min_port = min_port
+        self.max_port = max_port
+        self.size = max_port - min_port
+        self.lock = threading.Lock()
+        # slot 0 keeps the cursor
+        length = SLOT.size * (self.size + 1)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size < length:
+                os.ftruncate(self.fd, length)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.data = mmap.mmap(self.fd, length)
+
+    @contextmanager
+    def _locked(self):
+        # flock does not exclude the threads of this process
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _offset(self, port):
+        return SLOT.size * (port - self.min_port + 1)
+
+    def allocate(self):
+        """Reserve a port for this process."""
+        pid = os.getpid()
+        with self._locked():
+            cursor = SLOT.unpack_from(self.data, 0)[0]
+            for i in range(self.size):
+                port = self.min_port + (cursor + i) % self.size
+                offset = self._offset(port)
+                owner = SLOT.unpack_from(self.data, offset)[0]
+                if owner and _alive(owner):
+                    continue
+                SLOT.pack_into(self.data, offset, pid)
+                SLOT.pack_into(self.data, 0, (cursor + i + 1) % self.size)
+                return port
+        raise PipeException('no free ports in {}-{}'
+                            .format(self.min_port, self.max_port))
+
+    def release(self, port):
+        """Return a port reserved by this process."""
+        if not self.min_port <= port < self.max_port:
+            return
+        offset = self._offset(port)
+        with self._locked():
+            if SLOT.unpack_from(self.data, offset)[0] == os.getpid():
+                SLOT.pack_into(self.data, offset, 0)
+
+    def bind(self, socket, interface='tcp://*'):
+        """Bind ``socket`` to a port from the allocator and return it."""
+        for _ in range(self.size):
+            port = self.allocate()
+            try:
+                socket.bind('{}:{}'.format(interface, port))
+                return port
+            except zmq.ZMQError as exc:
+                # taken by a program that does not use the allocator,
+                # or by a closed socket not released yet
+                self.release(port)
+                if exc.errno != zmq.EADDRINUSE:
+                    raise
+        raise PipeException('no free ports in {}-{}'
+                            .format(self.min_port, self.max_port))
+
+    def close(self):
+        self.data.close()
+        os.close(self.fd)
@@ -26,6 +26,7 @@ import sys
 import os
 import importlib
 import subprocess
+import traceback
 
 # Add mischief package to sys.path, so the python subprocess can find
 # this same file
@@ -34,6 +35,7 @@ sys.path.insert(
         os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../')))
 
 from mischief.actors.actor import Actor, ActorRef
+from mischief.actors.pipe import Sender
 from mischief.exceptions import (ActorFinished, SpawnTimeoutError,
                                  PipeException)
 from mischief.tools import Addressable
@@ -57,11 +59,11 @@ class ProcessActorProxy(Addressable):
         Actor context closes it on exit
         """
         try:
-            with ActorRef(self.address()) as myself:
-                myself.close_actor()
+            # no handshake: if the actor was already closed, the
+            # message is just lost
+            with Sender(self.address(), handshake=False) as sender:
+                sender.close_receiver()
         except PipeException:
-            # If actor was already closed, ignore error from the
-            # reference trying to ping the actor
             pass
 
 
@@ -72,15 +74,21 @@ class ProcessActor(Actor):
     # create a regular instance.
     launch = True
 
+    # Name given to ``spawn``, used by the instance created in the
+    # new process
+    spawn_name = None
+
     def __init__(self, *args, **kwargs):
         if self.launch:
-            class_file = sys.modules[self.__class__.__module__].__file__
-            class_dir = os.path.abspath(os.path.dirname(class_file))
-            self.remote_addr, self.pid = start_actor(
-                self.__class__.__name__, self.__class__.__module__, class_dir)
+            self.remote_addr, self.pid = launch(self.__class__)
         else:
+            if not args and 'name' not in kwargs:
+                kwargs['name'] = self.spawn_name
             super(ProcessActor, self).__init__(*args, **kwargs)
 
+    def instance(self):
+        return os.getpid()
+
     def remote_init(self, msg):
         """
         Save addresses of other actors we want this process to
@@ -105,30 +113,41 @@ class ProcessActor(Actor):
         Utility function to start a process actor and initialize it
         """
         if name is not None:
-            with ActorRef((name, ip, None)) as ref:
-                # Do not start if it's already alive
-                if ref.is_alive():
-                    return ProcessActorProxy(*ref.full_address())
-        a = actor()
-
-        class Wait(Actor):
-            def act(self):
-                self.success = True
-                self.receive(
-                    finished_init=None,
-                    timed_out=lambda _: setattr(self, 'success', False),
-                    timeout=5)
-                return self.success
-
-        with ActorRef(a.remote_addr) as ref, Wait() as wait:
-            kwargs['ip'] = ip
-            ref.init(reply_to=wait, **kwargs)
-            if wait.act():
-                remote = list(a.remote_addr)
-                remote[1] = ip
-                return ProcessActorProxy(remote, a.pid)
-            else:
-                raise SpawnTimeoutError('failed to init remote process')
+            try:
+                with ActorRef((name, ip, None), remote=False) as ref:
+                    # Do not start if it's already alive
+                    if ref.is_alive():
+                        return ProcessActorProxy(*ref.full_address())
+            except PipeException:
+                pass
+        return spawn_new(actor, name, ip, **kwargs)
+
+
+def spawn_new(actor, name=None, ip='localhost', **kwargs):
+    """
+    Start a process actor and initialize it, without checking for a
+    live actor with the same name.
+    """
+    remote_addr, pid = launch(actor, name)
+
+    class Wait(Actor):
+        def act(self):
+            self.success = True
+            self.receive(
+                finished_init=None,
+                timed_out=lambda _: setattr(self, 'success', False),
+                timeout=5)
+            return self.success
+
+    with ActorRef(remote_addr) as ref, Wait() as wait:
+        kwargs['ip'] = ip
+        ref.init(reply_to=wait, **kwargs)
+        if wait.act():
+            remote = list(remote_addr)
+            remote[1] = ip
+            return ProcessActorProxy(remote, pid)
+        else:
+            raise SpawnTimeoutError('failed to init remote process')
 
 
 class WaitActor(Actor):
@@ -156,20 +175,28 @@ class WaitActor(Actor):
         self.pid = msg['pid']
 
 
-def start_actor(name, module, class_dir):
+def launch(cls, actor_name=None):
+    """Start a new process for the actor class ``cls``."""
+    class_file = sys.modules[cls.__module__].__file__
+    class_dir = os.path.abspath(os.path.dirname(class_file))
+    return start_actor(cls.__name__, cls.__module__, class_dir, actor_name)
+
+
+def start_actor(name, module, class_dir, actor_name=None):
     """
     Start a new Python subprocess.
 
     We pass the information of the client's object to instantiate, and
     the waiting actor to confirm that everything went well on
-    startup.
+    startup.  The actor is named ``actor_name``, if given.
     """
     myself = os.path.abspath(__file__)
     if myself.endswith('.pyc'):
         myself = myself[:-1]
     with WaitActor() as w:
         w_name, _, _ = w.address()
-        subprocess.Popen(['python', myself, w_name, name, module, class_dir])
+        subprocess.Popen(['python', myself, w_name, name, module, class_dir,
+                          actor_name or ''])
         return w.act()
 
 
@@ -179,10 +206,7 @@ class PEcho(ProcessActor):
         super(PEcho, self).__init__()
 
     def act(self):
-        while True:
-            self.receive(
-                _=self.do_pecho
-            )
+        self.receive_loop(self.compile_patterns(_=self.do_pecho))
 
     def do_pecho(self, msg):
         print('Process Echo:')
@@ -190,13 +214,15 @@ class PEcho(ProcessActor):
 
 
 if __name__ == '__main__':
-    _, wait_name, actor_class, actor_module, class_dir = sys.argv
+    (_, wait_name, actor_class, actor_module, class_dir,
+     actor_name) = sys.argv
     sys.path.insert(0, class_dir)
     mod = importlib.import_module(actor_module)
     cls = getattr(mod, actor_class)
     # Signal the base class ``ProcessActor`` to not start a new
     # subprocess (we are already in it!)
     cls.launch = False
+    cls.spawn_name = actor_name or None
     with cls() as actor, ActorRef(wait_name, remote=False) as wait:
         # Tell parent to keep going
         wait.ok(spawn_address=actor.address(), pid=os.getpid())
@@ -207,3 +233,9 @@ if __name__ == '__main__':
             actor._act()
         except KeyboardInterrupt:
             pass
+        except Exception:
+            if actor.supervisor is None:
+                raise
+            actor.notify_exit(traceback.format_exc())
+        else:
+            actor.notify_exit()
@@ -2,7 +2,7 @@ import os
 import signal
 
 from .process_actor import ProcessActor
-from .actor import ActorRef
+from .actor import ActorRef, handles
 
 
 class Register(ProcessActor):
@@ -15,19 +15,15 @@ class Register(ProcessActor):
         self.processes = {}
 
     def act(self):
-        while True:
-            self.receive(
-                register=self.register,
-                unregister=self.unregister,
-                killall=self.killall,
-                show=self.show
-            )
+        self.receive_loop()
 
+    @handles('show')
     def show(self, msg):
         print('List of processes registered:')
         for pid, name in self.processes.items():
             print('{:5d}: {}'.format(pid, name))
 
+    @handles('register')
     def register(self, msg):
         self.processes[msg.pid] = msg.name
 
@@ -37,9 +33,11 @@ class Register(ProcessActor):
         except KeyError:
             pass
 
+    @handles('unregister')
     def unregister(self, msg):
         self._unregister(msg.pid)
 
+    @handles('killall')
     def killall(self, msg):
         for pid, name in self.processes.items():
             try:
@@ -0,0 +1,221 @@
+"""
+Supervisors
+===========
+
+A ``Supervisor`` starts a list of children actors and restarts them
+when they crash.  Children keep their names across restarts, so
+``ActorRef``s to them resolve again.
+
+Use as::
+
+    sup = ThreadedActor.spawn(
+        Supervisor,
+        children=[Child(Worker, 'worker-1', x=1),
+                  Child(PWorker, 'worker-2')],
+        strategy=Supervisor.ONE_FOR_ONE)
+
+Children can be ``ThreadedActor``s or ``ProcessActor``s.  A child
+that finishes its ``act`` normally is not restarted.
+
+Supervisors can be children of other supervisors: when a supervisor
+exceeds its restart intensity it stops its children and crashes,
+which is reported to its own supervisor.
+
+"""
+
+import collections
+import os
+import signal
+import time
+
+from .actor import ActorRef, ThreadedActor
+from .process_actor import ProcessActor, spawn_new
+from ..exceptions import PipeException, RestartIntensityError
+from ..log import setup
+
+
+logger = setup(to=['file'])
+
+
+class Child(object):
+    """Specification of a supervised actor."""
+
+    STOP_TIMEOUT = 1
+
+    def __init__(self, actor, name, **kwargs):
+        self.actor = actor
+        self.name = name
+        self.kwargs = kwargs
+        self.handle = None
+        self.instance = None
+        self.finished = False
+
+    @property
+    def is_process(self):
+        return issubclass(self.actor, ProcessActor)
+
+    def start(self, supervisor):
+        kwargs = dict(self.kwargs, supervisor=supervisor)
+        if self.is_process:
+            self.handle = spawn_new(self.actor, name=self.name, **kwargs)
+            self.instance = self.handle.pid
+        else:
+            self.handle = ThreadedActor.spawn(
+                self.actor, name=self.name, **kwargs)
+            self.instance = self.handle.instance()
+        self.finished = False
+        logger.debug('started child {} ({})'.format(self.name, self.instance))
+
+    def stop(self, crashed=False):
+        """
+        Stop the current incarnation, if it is still running.
+
+        A crashed process is given some time to exit by itself;
+        otherwise, it is asked to close.  Processes still running
+        after ``STOP_TIMEOUT`` seconds are killed.
+
+        """
+        handle, self.handle, self.instance = self.handle, None, None
+        if handle is None:
+            return
+        if not self.is_process:
+            # the inbox may still be open after the thread of the
+            # actor died: close it and wait until it releases the
+            # name, so that a new incarnation can take it
+            if not handle.inbox.finished.is_set():
+                try:
+                    handle.close()
+                except PipeException:
+                    pass
+                handle.inbox.wait_closed(self.STOP_TIMEOUT)
+            return
+        if not crashed and not self._reap(handle.pid):
+            try:
+                with ActorRef(handle.address()) as ref:
+                    ref.close_actor()
+            except PipeException:
+                pass
+        deadline = time.time() + self.STOP_TIMEOUT
+        while time.time() < deadline:
+            if self._reap(handle.pid):
+                return
+            time.sleep(0.01)
+        try:
+            os.kill(handle.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self._reap(handle.pid, block=True)
+
+    def forget(self):
+        """Drop a child that finished normally."""
+        handle, self.handle, self.instance = self.handle, None, None
+        self.finished = True
+        if handle is not None and self.is_process:
+            self._reap(handle.pid, block=True)
+
+    def has_died(self):
+        """Check whether the process of a child exited unannounced."""
+        if not self.is_process or self.handle is None:
+            return False
+        return self._reap(self.handle.pid)
+
+    @staticmethod
+    def _reap(pid, block=False):
+        try:
+            return os.waitpid(pid, 0 if block else os.WNOHANG)[0] == pid
+        except OSError:
+            # not our child: check if it is still there
+            try:
+                os.kill(pid, 0)
+                return False
+            except OSError:
+                return True
+
+
+class Supervisor(ThreadedActor):
+    """
+    Restart crashed children.
+
+    Keyword arguments (set when spawning):
+
+    * ``children``: list of ``Child``
+    * ``strategy``: ``ONE_FOR_ONE`` restarts only the crashed child,
+      ``ONE_FOR_ALL`` restarts all of them
+    * ``max_restarts``, ``max_seconds``: give up when there are more
+      than ``max_restarts`` restarts in ``max_seconds`` seconds
+    * ``backoff``, ``max_backoff``: wait ``backoff`` seconds before
+      a restart, doubling for each recent restart, up to
+      ``max_backoff``
+    * ``check_interval``: how often to check for process children
+      that died without notice (for example, killed)
+
+    """
+
+    ONE_FOR_ONE = 'one_for_one'
+    ONE_FOR_ALL = 'one_for_all'
+
+    children = ()
+    strategy = ONE_FOR_ONE
+    max_restarts = 3
+    max_seconds = 5
+    backoff = 0.05
+    max_backoff = 2
+    check_interval = 0.2
+
+    def act(self):
+        self.restarts = collections.deque()
+        try:
+            for child in self.children:
+                child.start(self.address())
+            while True:
+                self.receive(
+                    child_exited=self.child_exited,
+                    timed_out=self.check_children,
+                    timeout=self.check_interval)
+        finally:
+            for child in reversed(self.children):
+                child.stop()
+
+    def _child(self, name):
+        for child in self.children:
+            if child.name == name:
+                return child
+
+    def child_exited(self, msg):
+        child = self._child(msg.name)
+        if child is None or child.instance != msg.instance:
+            # stale notice from an incarnation already replaced
+            return
+        if msg.reason is None:
+            logger.debug('child {} finished'.format(child.name))
+            child.forget()
+            return
+        logger.debug('child {} crashed:\n{}'.format(child.name, msg.reason))
+        self.restart(child)
+
+    def check_children(self, msg):
+        for child in self.children:
+            if child.has_died():
+                logger.debug('child {} died'.format(child.name))
+                child.handle = child.instance = None
+                self.restart(child)
+
+    def restart(self, child):
+        now = time.time()
+        self.restarts.append(now)
+        while self.restarts[0] < now - self.max_seconds:
+            self.restarts.popleft()
+        if len(self.restarts) > self.max_restarts:
+            raise RestartIntensityError(
+                'more than {} restarts in {} seconds'
+                .format(self.max_restarts, self.max_seconds))
+        time.sleep(min(self.backoff * 2 ** (len(self.restarts) - 1),
+                       self.max_backoff))
+        if self.strategy == self.ONE_FOR_ALL:
+            targets = [c for c in self.children if not c.finished]
+        else:
+            targets = [child]
+        for target in reversed(targets):
+            target.stop(crashed=target is child)
+        for target in targets:
+            target.start(self.address())
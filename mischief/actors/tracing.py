@@ -0,0 +1,203 @@
+"""
+Request tracing
+===============
+
+A message can carry a trace context in its ``trace`` field::
+
+    {'tag': 'work', 'trace': [trace_id, parent_span_id], ...}
+
+When an actor receives a traced message, the handler runs inside a
+new ``Span``, child of the one that sent the message.  The span
+records when the message arrived to the inbox, when it was taken
+from it, and how long the handler took.  Messages sent with
+``ActorRef.send`` while a span is current carry its context, so a
+trace follows a request through a chain of actors, across processes.
+
+Start a trace with ``span``, and choose where spans go with
+``set_exporter``::
+
+    tracing.set_exporter(tracing.FileExporter('/tmp/spans.jsonl'))
+    with tracing.span('request'):
+        ref.work(x=1)
+
+Spans are exported as dicts with the field names of the OpenTelemetry
+(OTLP) JSON encoding.  Without an exporter, the context is still
+propagated, but spans are discarded.
+
+"""
+
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+_exporter = None
+
+
+def set_exporter(exporter):
+    """Send finished spans to ``exporter`` (``None`` to discard them)."""
+    global _exporter
+    _exporter = exporter
+
+
+def _new_id(bits):
+    return '{:0{}x}'.format(random.getrandbits(bits), bits // 4)
+
+
+class Span(object):
+    """A timed operation in a trace."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'actor',
+                 'enqueued', 'dequeued', 'start', 'end', 'error')
+
+    def __init__(self, name, trace_id=None, parent_id=None, actor=None):
+        self.trace_id = trace_id or _new_id(128)
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.actor = actor
+        self.enqueued = self.dequeued = None
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    def context(self):
+        """The trace context of messages sent from this span."""
+        return [self.trace_id, self.span_id]
+
+    def to_dict(self):
+        attributes = {}
+        if self.actor is not None:
+            attributes['actor'] = self.actor
+        if self.enqueued is not None:
+            attributes['queue_seconds'] = self.dequeued - self.enqueued
+        if self.error is not None:
+            attributes['error'] = self.error
+        return {'traceId': self.trace_id,
+                'spanId': self.span_id,
+                'parentSpanId': self.parent_id or '',
+                'name': self.name,
+                'startTimeUnixNano': int(self.start * 1e9),
+                'endTimeUnixNano': int(self.end * 1e9),
+                'attributes': attributes}
+
+    def finish(self):
+        self.end = time.time()
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(self)
+
+
+def current():
+    """Return the current span of this thread, or ``None``."""
+    return getattr(_local, 'span', None)
+
+
+@contextmanager
+def span(name):
+    """Run the block in a span, child of the current one if any."""
+    parent = current()
+    s = (Span(name, parent.trace_id, parent.span_id) if parent else
+         Span(name))
+    _local.span = s
+    try:
+        yield s
+    except Exception as exc:
+        s.error = repr(exc)
+        raise
+    finally:
+        _local.span = parent
+        s.finish()
+
+
+def inject(msg):
+    """Add the current trace context to ``msg``, if there is one."""
+    s = getattr(_local, 'span', None)
+    if s is not None and 'trace' not in msg:
+        msg['trace'] = s.context()
+
+
+def handle(actor, action, msg):
+    """Run ``action(msg)`` for ``actor`` in a span continuing the
+    trace of ``msg``."""
+    dequeued = time.time()
+    trace_id, parent_id = msg.trace
+    s = Span('{}.{}'.format(type(actor).__name__, msg.tag),
+             trace_id, parent_id, actor.name)
+    s.dequeued = dequeued
+    s.enqueued = msg.enqueued if msg.enqueued is not None else dequeued
+    parent = getattr(_local, 'span', None)
+    _local.span = s
+    try:
+        return action(msg)
+    except Exception as exc:
+        s.error = repr(exc)
+        raise
+    finally:
+        _local.span = parent
+        s.finish()
+
+
+class FileExporter(object):
+    """Append spans to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def export(self, span):
+        line = json.dumps(span.to_dict()) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ActorExporter(object):
+    """Send spans in batches to a collector actor at ``address``.
+
+    The collector receives messages::
+
+        {'tag': 'export_spans', 'spans': [...]}
+
+    Spans are sent when ``batch_size`` of them are waiting, or on
+    ``flush``.
+    """
+
+    def __init__(self, address, batch_size=100):
+        self.address = address
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span):
+        with self.lock:
+            self.spans.append(span.to_dict())
+            if len(self.spans) < self.batch_size:
+                return
+            spans, self.spans = self.spans, []
+        self._send(spans)
+
+    def flush(self):
+        with self.lock:
+            spans, self.spans = self.spans, []
+        if spans:
+            self._send(spans)
+
+    def _send(self, spans):
+        # imported here, since the actors module uses this one
+        from .actor import ActorRef
+        # avoid tracing the export itself
+        parent = getattr(_local, 'span', None)
+        _local.span = None
+        try:
+            with ActorRef(self.address) as collector:
+                collector.export_spans(spans=spans)
+        finally:
+            _local.span = parent
@@ -13,3 +13,7 @@ class ActorFinished(Exception):
 
 class SpawnTimeoutError(Exception):
     pass
+
+
+class RestartIntensityError(Exception):
+    pass
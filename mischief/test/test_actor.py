@@ -1,12 +1,19 @@
+import copy
+import json
+import logging
+import pickle
 import time
 import os
 
 
 import pytest
 
-from mischief.actors.actor import Actor, ActorRef, ThreadedActor
+from mischief.actors.actor import (Actor, ActorRef, ThreadedActor, Patterns,
+                                   close_all, handles)
 from mischief.exceptions import ActorFinished, PipeException
 from mischief.actors.process_actor import ProcessActor
+from mischief.actors.message import Message, encode_default
+from mischief.actors.pipe import ACTORS_DIRECTORY
 
 @pytest.yield_fixture(scope='module')
 def threaded_actor():
@@ -441,4 +448,165 @@ def test_ref_with_proxy(process_actor):
 def test_reply_to_proxy(process_actor):
     with ActorRef(process_actor) as ref:
         ref.foo(reply_to=process_actor)
-        assert ref.is_alive()
\ No newline at end of file
+        assert ref.is_alive()
+
+def test_message_envelope():
+    body = {'tag': 'foo', 'reply_to': ['a', 'localhost', None], 'x': 1}
+    msg = Message(body)
+    assert msg.tag == 'foo' and msg['x'] == 1 and msg.x == 1
+    assert msg.reply_to == ['a', 'localhost', None]
+    assert msg.correlation_id is None
+    msg.y = 2
+    assert body['y'] == 2
+    del msg['tag']
+    assert msg.tag is None and 'tag' not in body
+    assert dict(**msg) == body
+    assert msg == body
+    with pytest.raises(AttributeError):
+        msg.missing
+    assert json.loads(json.dumps({'m': msg}, default=encode_default)) == \
+        {'m': body}
+
+def test_message_copy():
+    body = {'tag': 'foo', 'x': [1]}
+    msg = Message(body)
+    shallow = copy.copy(msg)
+    shallow['y'] = 2
+    assert shallow.tag == 'foo' and 'y' not in body
+    deep = copy.deepcopy(msg)
+    deep['x'].append(2)
+    assert deep == {'tag': 'foo', 'x': [1, 2]} and body['x'] == [1]
+    unpickled = pickle.loads(pickle.dumps(msg))
+    assert unpickled == body and unpickled.tag == 'foo'
+
+def test_message_forwarding():
+    class T(ThreadedActor):
+        def act(self):
+            self.receive(fwd=self.fwd)
+        def fwd(self, msg):
+            with ActorRef(msg.reply_to) as sender:
+                sender.reply(got=msg)
+    with T() as t, ActorRef(t) as t_ref:
+        answer = t_ref.sync('fwd', x=[1, 2])
+        assert answer['got']['x'] == [1, 2]
+
+def test_receive_loop_with_handles():
+    class T(ThreadedActor):
+        def act(self):
+            self.receive_loop()
+        @handles('add', 'plus')
+        def add(self, msg):
+            with ActorRef(msg.reply_to) as sender:
+                sender.reply(x=msg.a + msg.b)
+    with T() as t, ActorRef(t) as t_ref:
+        assert t_ref.sync('add', a=1, b=2)['x'] == 3
+        assert t_ref.sync('plus', a=3, b=4)['x'] == 7
+
+def test_compile_patterns():
+    class A(Actor):
+        @handles('foo')
+        def foo(self, msg):
+            self.got = msg.tag
+        def bar(self, msg):
+            self.got = msg.tag
+    with A() as a, ActorRef(a) as a_ref:
+        table = a.compile_patterns(bar='bar', baz=None)
+        assert isinstance(table, Patterns)
+        assert table['bar'] == a.bar and table['foo'] == a.foo
+        a_ref.bar()
+        a.receive(table)
+        assert a.got == 'bar'
+        a_ref.foo()
+        a.receive(table)
+        assert a.got == 'foo'
+        a_ref.qux()
+        a.receive(table, qux=a.bar)
+        assert a.got == 'qux'
+
+def test_conflated_inbox():
+    class A(Actor):
+        CONFLATE = {'progress': None}
+        def act(self):
+            self.receive(progress=self.read_value('value'))
+            return self.value
+    with A() as a, ActorRef(a) as a_ref:
+        for i in range(10):
+            a_ref.progress(value=i)
+        a_ref.done()
+        while a.inbox.qsize() < 2:
+            time.sleep(0.01)
+        assert a.inbox.qsize() == 2
+        assert a.act() == 9
+
+def test_receive_skips_formatting_without_debug(monkeypatch):
+    import mischief.actors.actor as actor_module
+    class A(Actor):
+        def act(self):
+            self.receive(foo=None)
+            return True
+    def fail(*args, **kwargs):
+        raise AssertionError('message formatted')
+    monkeypatch.setattr(actor_module, 'show_msg', fail)
+    actor_module.logger.setLevel(logging.INFO)
+    try:
+        with A() as a, ActorRef(a) as a_ref:
+            a_ref.foo()
+            assert a.act()
+    finally:
+        actor_module.logger.setLevel(logging.DEBUG)
+
+def test_conflate_and_durable_conflict():
+    class A(Actor):
+        CONFLATE = {'progress': None}
+        DURABLE = True
+    with pytest.raises(ValueError):
+        A()
+
+def test_subscribe():
+    from mischief.actors.pipe import Publisher
+    class A(Actor):
+        def act(self):
+            self.receive(news=self.read_value('x'))
+            return self.x
+    with Publisher('news-pub', use_remote=False) as pub, A() as a:
+        a.subscribe(pub, 'news')
+        while not a.inbox.qsize():
+            pub.publish('news', x=1)
+            time.sleep(0.01)
+        assert a.act() == 1
+
+def test_process_actor_with_mux_transport(monkeypatch):
+    monkeypatch.setenv('MISCHIEF_TRANSPORT', 'mux')
+    with ProcessActor.spawn(EchoProcessActor) as p, \
+            ActorRef(p.address()) as p_ref:
+        assert os.path.islink(os.path.join(ACTORS_DIRECTORY, p_ref.name))
+        assert p_ref.sync('echo', x=4)['x'] == 4
+        p_ref.close_actor()
+        assert not p_ref.is_alive()
+
+def test_close_all(namebroker):
+    class A(Actor):
+        def act(self):
+            self.receive(closed=self.read_value('names'))
+            return self.names
+    actors = [Actor() for _ in range(20)]
+    for actor in actors[:5]:
+        actor.export()
+    assert all(namebroker.send('localhost', {'__tag__': 'get',
+                                             '__name__': a.name})['__port__']
+               for a in actors[:5])
+    with A() as confirm:
+        close_all(actors, confirm=confirm)
+        assert sorted(confirm.act()) == sorted(a.name for a in actors)
+    assert all(a.inbox.closed for a in actors)
+    assert not any(namebroker.send('localhost', {'__tag__': 'get',
+                                                 '__name__': a.name})
+                   ['__port__'] for a in actors[:5])
+
+def test_close_twice():
+    a = Actor()
+    a.close()
+    a.close()
+    a.inbox.wait_closed(1)
+    with a:
+        pass
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from mischief.actors.actor import Actor, ActorRef
+from mischief.actors.durable import DurableMailbox
+from mischief.actors.message import Message
+from mischief.exceptions import PipeException
+
+
+def msg(i):
+    return Message({'tag': 'foo', 'i': i})
+
+
+def test_spill_to_disk(tmpdir):
+    m = DurableMailbox('spill', directory=str(tmpdir), memory_limit=3)
+    for i in range(10):
+        m.put(msg(i))
+    assert m.in_memory == 3
+    got = [m.get() for _ in range(10)]
+    assert [x['i'] for x in got] == list(range(10))
+    assert [x.seq for x in got] == list(range(10))
+    m.close()
+
+
+def test_replay_unacked(tmpdir):
+    m = DurableMailbox('replay', directory=str(tmpdir), memory_limit=2)
+    for i in range(5):
+        m.put(msg(i))
+    for _ in range(3):
+        m.ack(m.get())
+    # a crash before processing the last two messages
+    m.close()
+    m = DurableMailbox('replay', directory=str(tmpdir))
+    assert m.qsize() == 2
+    replayed = [m.get(), m.get()]
+    assert [x['i'] for x in replayed] == [3, 4]
+    m.put(msg(5))
+    assert m.get().seq == 5
+    m.close()
+
+
+def test_acked_segments_are_removed(tmpdir):
+    m = DurableMailbox('clean', directory=str(tmpdir))
+    m.SEGMENT_SIZE = 64
+    for i in range(10):
+        m.put(msg(i))
+    for _ in range(10):
+        m.ack(m.get())
+    m.close()
+    assert os.listdir(str(tmpdir)) == ['lock']
+
+
+def test_acks_kept_with_live_older_segment(tmpdir):
+    m = DurableMailbox('acks', directory=str(tmpdir))
+    m.SEGMENT_SIZE = 64
+    for i in range(8):
+        m.put(msg(i))
+    got = [m.get() for _ in range(8)]
+    m.ack(got[0])
+    for x in got[2:]:
+        m.ack(x)
+    m.close()
+    m = DurableMailbox('acks', directory=str(tmpdir))
+    assert [m.get()['i']] == [1] and m.qsize() == 0
+    m.close()
+
+
+def test_ack_after_close(tmpdir):
+    m = DurableMailbox('late', directory=str(tmpdir))
+    m.put(msg(0))
+    x = m.get()
+    m.close()
+    m.ack(x)
+
+
+def test_requeue_respills(tmpdir):
+    m = DurableMailbox('requeue', directory=str(tmpdir), memory_limit=2)
+    for i in range(5):
+        m.put(msg(i))
+    for _ in range(20):
+        m.requeue(m.get())
+    assert m.in_memory <= 2
+    assert sorted(m.get()['i'] for _ in range(5)) == list(range(5))
+    m.close()
+
+
+def test_single_open_mailbox(tmpdir):
+    m = DurableMailbox('single', directory=str(tmpdir))
+    with pytest.raises(PipeException):
+        DurableMailbox('single', directory=str(tmpdir))
+    m.close()
+
+
+def test_sync_interval(tmpdir):
+    m = DurableMailbox('sync', directory=str(tmpdir), sync_interval=0.01)
+    m.put(msg(0))
+    for _ in range(100):
+        if not m.unsynced:
+            break
+        time.sleep(0.01)
+    assert m.unsynced == 0
+    m.close()
+
+
+def test_durable_actor(tmpdir):
+    class A(Actor):
+        DURABLE = True
+        def act(self):
+            self.receive(foo=self.read_value('i'))
+            return self.i
+    name = 'durable-{}'.format(os.getpid())
+    with A(name) as a, ActorRef(a) as a_ref:
+        a_ref.foo(i=1)
+        a_ref.foo(i=2)
+        assert a.act() == 1
+    with A(name) as a:
+        assert a.act() == 2
@@ -1,11 +1,16 @@
 import zmq
+import json
+import os
+import time
 
 from flexmock import flexmock
 import pytest
 import mischief.actors.pipe as p
+import mischief.actors.compression as c
 import mischief.actors.namebroker as n
 from mischief.exceptions import PipeEmpty
 from mischief.zmq_tools import zmq_socket
+from mischief.actors.message import Message
 
 def test_get_local_ip():
     locals = ['localhost', '127.0.0.1', '127.0.0.2']
@@ -34,8 +39,10 @@ def test_receiver_local():
 
 def test_receiver_remote(namebroker):
     with p.Receiver('foo', use_remote=True) as r:
-        port = r.address()[-1]
+        assert r.address()[-1] is None
+        port = r.export()[-1]
         assert isinstance(port, int) and port > 0
+        assert r.address()[-1] == port
         assert r.qsize() == 0
         with pytest.raises(PipeEmpty):
             r.get(timeout=0)
@@ -57,7 +64,25 @@ def test_receiver_register_unregister(namebroker):
     n.NameBrokerClient.should_receive('send').with_args(
         'localhost', Msg('unregister', 'foo')).once()
     with p.Receiver('foo', use_remote=True) as r:
-        pass
+        r.export()
+
+def test_receiver_lazy_register(namebroker):
+    flexmock(n.NameBrokerClient).should_receive('send').never()
+    with p.Receiver('foo', use_remote=True) as r:
+        assert r.address() == ('foo', 'localhost', None)
+
+def test_receiver_eager_register(namebroker):
+    flexmock(n.NameBrokerClient).should_receive('send').twice()
+    with p.Receiver('foo', use_remote=True, ignore_namebroker=False) as r:
+        assert r.address()[-1] is not None
+
+def test_export_addresses(namebroker):
+    with p.Receiver('foo') as r:
+        msg = {'tag': 'spam', 'reply_to': ('foo', 'localhost', None),
+               'confirm_to': ('bar', 'localhost', None)}
+        p.export_addresses(msg)
+        assert msg['reply_to'] == r.address() != ('foo', 'localhost', None)
+        assert msg['confirm_to'] == ('bar', 'localhost', None)
 
 def test_receiver_ping(namebroker):
     with p.Receiver('foo') as r, p.Receiver('bar') as b:
@@ -90,3 +115,141 @@ def test_receiver_other_data(namebroker):
         assert r.get() == {'tag': 'spam'}
         
         
+
+def test_conflating_mailbox():
+    m = p.ConflatingMailbox({'progress': None, 'position': 'id'})
+    for i in range(5):
+        m.put(Message({'tag': 'progress', 'value': i}))
+        m.put(Message({'tag': 'position', 'id': i % 2, 'value': i}))
+    m.put(Message({'tag': 'other'}))
+    assert m.qsize() == 4
+    assert m.get()['value'] == 4
+    first = m.get()
+    assert (first['id'], first['value']) == (0, 4)
+    m.put(Message({'tag': 'progress', 'value': 5}))
+    m.requeue(Message({'tag': 'progress', 'value': 0}))
+    assert [m.get().get('value') for _ in range(2)] == [3, None]
+    assert m.get()['value'] == 5
+    assert m.qsize() == 0
+
+def test_sender_in_same_process():
+    with p.Receiver('foo', use_remote=False) as r:
+        with p.Sender(r.address()) as s:
+            assert s.receiver is r and s.socket is None
+            msg = {'tag': 'spam', 'x': [1]}
+            s.put(msg)
+            msg['x'].append(2)
+            assert r.get(timeout=1) == {'tag': 'spam', 'x': [1]}
+
+def test_sender_in_same_process_copies():
+    with p.Receiver('foo', use_remote=False) as r:
+        shared = {'tag': 'spam', 'x': [1]}
+        with p.Sender(r.address(), local_copy='deepcopy') as s:
+            s.put(shared)
+            assert r.get(timeout=1)['x'] is not shared['x']
+        with p.Sender(r.address(), local_copy=None) as s:
+            s.put(shared)
+            assert r.get(timeout=1)['x'] is shared['x']
+
+def test_sender_after_receiver_closed():
+    r = p.Receiver('foo', use_remote=False)
+    s = p.Sender(r.address())
+    r.close()
+    r.reader_thread.join()
+    assert p.local_receiver(r.address()) is None
+    with p.Receiver('foo', use_remote=False) as r2:
+        s.put({'tag': 'spam'})
+        assert s.receiver is r2
+        assert r2.get(timeout=1) == {'tag': 'spam'}
+    s.close()
+
+def _publish_until(r, publish, timeout=5):
+    # subscriptions take a moment to reach the publisher
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        publish()
+        try:
+            return r.get(timeout=0.05)
+        except PipeEmpty:
+            pass
+    raise AssertionError('nothing received')
+
+def test_publisher_filters_topics():
+    with p.Publisher('pub', use_remote=False) as pub, \
+            p.Receiver('foo', use_remote=False) as r, \
+            p.Receiver('bar', use_remote=False) as r2:
+        r.subscribe(pub, ['eur'])
+        r2.subscribe(pub.address(), ['eur.usd', 'gbp'])
+        msg = _publish_until(r, lambda: pub.publish('eur.usd', x=1))
+        assert msg == {'tag': 'eur.usd', 'x': 1}
+        assert r2.get(timeout=1) == msg
+        time.sleep(0.1)
+        for receiver in r, r2:
+            while receiver.qsize():
+                receiver.read(block=False)
+        pub.publish('gbp', {'tag': 'price'}, x=2)
+        pub.publish('eur', x=3)
+        assert r2.get(timeout=1) == {'tag': 'price', 'x': 2}
+        assert r.get(timeout=1) == {'tag': 'eur', 'x': 3}
+        r.unsubscribe(pub)
+        pub.publish('gbp', x=4)
+        assert r2.get(timeout=1)['x'] == 4
+        assert r.qsize() == 0
+
+def test_compression_encode_decode():
+    small = {'tag': 'spam'}
+    assert c.encode(small, 'zlib') == json.dumps(small).encode('utf-8')
+    big = {'tag': 'spam', 'data': 'x' * 10000}
+    frame = c.encode(big, 'zlib')
+    assert frame[:1] == c.MARK and len(frame) < 1000
+    assert c.decode(frame) == big
+    assert c.encode(big, 'zlib', threshold=None)[:1] != c.MARK
+    assert c.choose_codec(['snappy', 'zlib']) == 'zlib'
+    assert c.choose_codec(None) is None
+
+def test_sender_compresses_over_tcp(namebroker, monkeypatch):
+    # avoid the delivery in the same process
+    monkeypatch.setattr(p, 'local_receiver', lambda address: None)
+    big = {'tag': 'spam', 'data': 'x' * 10000}
+    with p.Receiver('foo') as r:
+        r.export()
+        with p.Sender(r.address(), use_local=False) as s:
+            assert s.codec == 'zlib'
+            s.put(big)
+            assert r.get(timeout=1) == big
+        with p.Sender(r.address(), use_local=False,
+                      compress_threshold=None) as s:
+            assert s.codec is None
+        with p.Sender(r.address()) as s:
+            assert s.local and s.codec is None
+            s.put(big)
+            assert r.get(timeout=1) == big
+
+def test_mux_transport(monkeypatch):
+    # avoid the delivery in the same process
+    monkeypatch.setattr(p, 'local_receiver', lambda address: None)
+    r = p.Receiver('foo', transport='mux')
+    with p.Receiver('bar', transport='mux') as r2:
+        assert r.socket is None and r.reader_thread is None
+        assert os.readlink(r.path) == os.readlink(r2.path)
+        with p.Sender(r.address()) as s, p.Sender(r2.address()) as s2:
+            assert s.socket is None and s.mux is s2.mux
+            s.put({'tag': 'spam'})
+            s2.put({'tag': 'eggs'})
+            assert r.get(timeout=1) == {'tag': 'spam'}
+            assert r2.get(timeout=1) == {'tag': 'eggs'}
+        r.close()
+        r.wait_closed(1)
+        assert r.closed and not os.path.lexists(r.path)
+        assert r.get(timeout=1) is None
+
+def test_mux_transport_export(namebroker, monkeypatch):
+    monkeypatch.setattr(p, 'local_receiver', lambda address: None)
+    big = {'tag': 'spam', 'data': 'x' * 10000}
+    with p.Receiver('foo', transport='mux') as r:
+        port = r.export()[-1]
+        assert port.startswith(p.MUX_PREFIX)
+        with p.Sender(r.address(), use_local=False) as s:
+            assert s.mux.url.startswith('tcp://') and s.codec == 'zlib'
+            s.put(big)
+            assert r.get(timeout=1) == big
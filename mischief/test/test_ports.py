@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+import pytest
+import zmq
+
+from mischief.actors.ports import PortAllocator, SLOT
+from mischief.exceptions import PipeException
+from mischief.zmq_tools import zmq_socket
+
+
+@pytest.yield_fixture
+def allocator(tmpdir):
+    a = PortAllocator(str(tmpdir.join('ports')), 61000, 61004)
+    yield a
+    a.close()
+
+
+def test_allocate_next_fit(allocator):
+    ports = [allocator.allocate() for _ in range(4)]
+    assert ports == [61000, 61001, 61002, 61003]
+    with pytest.raises(PipeException):
+        allocator.allocate()
+    allocator.release(61001)
+    assert allocator.allocate() == 61001
+
+
+def test_shared_between_allocators(allocator, tmpdir):
+    other = PortAllocator(str(tmpdir.join('ports')), 61000, 61004)
+    try:
+        assert allocator.allocate() == 61000
+        assert other.allocate() == 61001
+    finally:
+        other.close()
+
+
+def test_reclaim_ports_of_dead_processes(allocator):
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    for port in range(61000, 61004):
+        SLOT.pack_into(allocator.data, allocator._offset(port), proc.pid)
+    assert allocator.allocate() == 61000
+    assert SLOT.unpack_from(
+        allocator.data, allocator._offset(61000))[0] == os.getpid()
+
+
+def test_bind_skips_ports_in_use(allocator):
+    with zmq_socket(zmq.PULL) as busy, zmq_socket(zmq.PULL) as s:
+        busy.bind('tcp://*:61000')
+        assert allocator.bind(s) == 61001
+    allocator.release(61001)
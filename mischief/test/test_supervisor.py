@@ -0,0 +1,99 @@
+import os
+import signal
+import time
+
+import pytest
+
+from mischief.actors.actor import ActorRef, ThreadedActor
+from mischief.actors.process_actor import ProcessActor
+from mischief.actors.supervisor import Child, Supervisor
+
+
+class Crashy(ThreadedActor):
+    def act(self):
+        while True:
+            self.receive(
+                crash=self.crash,
+                echo=self.echo)
+    def crash(self, msg):
+        raise ValueError('crash')
+    def echo(self, msg):
+        with ActorRef(msg.reply_to) as sender:
+            sender.reply(x=self.x)
+
+
+class PCrashy(ProcessActor):
+    def act(self):
+        while True:
+            self.receive(echo=self.echo)
+    def echo(self, msg):
+        with ActorRef(msg.reply_to) as sender:
+            sender.reply(pid=os.getpid())
+
+
+def wait_for(f, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            result = f()
+            if result:
+                return result
+        except Exception:
+            pass
+        time.sleep(0.05)
+    assert False, 'timed out'
+
+
+def test_one_for_one_restart(namebroker):
+    name = 'crashy-{}'.format(os.getpid())
+    children = [Child(Crashy, name, x=1), Child(Crashy, name + '-2', x=2)]
+    with ThreadedActor.spawn(Supervisor, children=children):
+        with ActorRef((name, 'localhost', None), remote=False) as ref:
+            assert ref.sync('echo')['x'] == 1
+            first, other = children[0].handle, children[1].handle
+            ref.crash()
+            wait_for(lambda: children[0].handle not in (None, first))
+        with ActorRef((name, 'localhost', None), remote=False) as ref:
+            assert ref.sync('echo')['x'] == 1
+        assert children[1].handle is other
+
+
+def test_one_for_all_restart(namebroker):
+    name = 'crashy-all-{}'.format(os.getpid())
+    children = [Child(Crashy, name, x=1), Child(Crashy, name + '-2', x=2)]
+    with ThreadedActor.spawn(Supervisor, children=children,
+                             strategy=Supervisor.ONE_FOR_ALL):
+        wait_for(lambda: children[1].handle)
+        first, second = children[0].handle, children[1].handle
+        with ActorRef(first) as ref:
+            ref.crash()
+        wait_for(lambda: children[0].handle not in (None, first) and
+                 children[1].handle not in (None, second))
+
+
+def test_restart_intensity(namebroker):
+    name = 'crashy-limit-{}'.format(os.getpid())
+    children = [Child(Crashy, name, x=1)]
+    sup = ThreadedActor.spawn(Supervisor, children=children,
+                              max_restarts=1, backoff=0)
+    for _ in range(2):
+        handle = wait_for(lambda: children[0].handle)
+        with ActorRef(handle) as ref:
+            ref.crash()
+        wait_for(lambda: children[0].handle is not handle)
+    sup.thread.join(5)
+    assert not sup.thread.is_alive()
+    sup.close()
+
+
+def test_process_restart(namebroker):
+    name = 'pcrashy-{}'.format(os.getpid())
+    children = [Child(PCrashy, name)]
+    with ThreadedActor.spawn(Supervisor, children=children):
+        proxy = wait_for(lambda: children[0].handle)
+        with ActorRef(proxy) as ref:
+            assert ref.sync('echo')['pid'] == proxy.pid
+        os.kill(proxy.pid, signal.SIGKILL)
+        wait_for(lambda: children[0].handle not in (None, proxy))
+        with ActorRef((name, 'localhost', None), remote=False) as ref:
+            assert ref.sync('echo')['pid'] == children[0].handle.pid
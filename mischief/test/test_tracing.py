@@ -0,0 +1,108 @@
+import json
+import time
+
+import pytest
+
+from mischief.actors import tracing
+from mischief.actors.actor import Actor, ActorRef, ThreadedActor
+
+
+class ListExporter(object):
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+
+@pytest.yield_fixture
+def exporter():
+    e = ListExporter()
+    tracing.set_exporter(e)
+    yield e
+    tracing.set_exporter(None)
+
+
+class Front(ThreadedActor):
+    def act(self):
+        while True:
+            self.receive(work=self.work)
+    def work(self, msg):
+        with ActorRef(msg['back']) as back:
+            back.work(reply_to=msg['reply_to'])
+
+
+class Back(ThreadedActor):
+    def act(self):
+        while True:
+            self.receive(work=self.work)
+    def work(self, msg):
+        time.sleep(0.01)
+        with ActorRef(msg['reply_to']) as ref:
+            ref.done()
+
+
+def test_trace_across_actors(exporter):
+    with ThreadedActor.spawn(Front) as front, \
+            ThreadedActor.spawn(Back) as back, \
+            ActorRef(front) as front_ref:
+        with tracing.span('request') as root:
+            assert front_ref.sync('work', back=back.address())['tag'] == 'done'
+    spans = dict((s['name'], s) for s in exporter.spans)
+    assert set(spans) == set(['request', 'Front.work', 'Back.work',
+                              '_ReplyWaiter.done'])
+    assert all(s['traceId'] == root.trace_id for s in spans.values())
+    assert spans['request']['parentSpanId'] == ''
+    assert (spans['Front.work']['parentSpanId'] ==
+            spans['request']['spanId'])
+    assert (spans['Back.work']['parentSpanId'] ==
+            spans['Front.work']['spanId'])
+    assert (spans['_ReplyWaiter.done']['parentSpanId'] ==
+            spans['Back.work']['spanId'])
+    back_span = spans['Back.work']
+    assert (back_span['endTimeUnixNano'] - back_span['startTimeUnixNano']
+            >= 1e7)
+    assert back_span['attributes']['queue_seconds'] >= 0
+
+
+def test_untraced_messages(exporter):
+    with ThreadedActor.spawn(Front) as front, \
+            ThreadedActor.spawn(Back) as back, \
+            ActorRef(front) as front_ref:
+        front_ref.sync('work', back=back.address())
+    assert exporter.spans == []
+
+
+def test_file_exporter(tmpdir):
+    path = str(tmpdir.join('spans.jsonl'))
+    exporter = tracing.FileExporter(path)
+    tracing.set_exporter(exporter)
+    try:
+        with tracing.span('outer'):
+            with tracing.span('inner'):
+                pass
+    finally:
+        tracing.set_exporter(None)
+        exporter.close()
+    with open(path) as f:
+        inner, outer = [json.loads(line) for line in f]
+    assert inner['parentSpanId'] == outer['spanId']
+
+
+def test_actor_exporter():
+    class Collector(Actor):
+        def act(self):
+            self.receive(export_spans=self.read_value('spans'))
+            return self.spans
+    with Collector() as collector:
+        exporter = tracing.ActorExporter(collector.address(), batch_size=2)
+        tracing.set_exporter(exporter)
+        try:
+            with tracing.span('a'):
+                pass
+            with tracing.span('b'):
+                pass
+        finally:
+            tracing.set_exporter(None)
+        assert [s['name'] for s in collector.act()] == ['a', 'b']
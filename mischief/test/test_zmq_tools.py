@@ -0,0 +1,47 @@
+import json
+
+import pytest
+import zmq
+
+import mischief.zmq_tools as zt
+
+
+@pytest.fixture
+def options(monkeypatch):
+    monkeypatch.setattr(zt, 'OPTIONS', {'ALL': {'LINGER': 5000}})
+    return zt.OPTIONS
+
+
+def test_options_per_socket_type(options):
+    zt.configure(sockets={'push': {'sndhwm': 123, 'tcp_keepalive': 1},
+                          'all': {'linger': 10}})
+    with zt.zmq_socket(zmq.PUSH) as push, zt.zmq_socket(zmq.PULL) as pull:
+        assert push.get(zmq.SNDHWM) == 123
+        assert push.get(zmq.TCP_KEEPALIVE) == 1
+        assert pull.get(zmq.SNDHWM) != 123
+        assert push.get(zmq.LINGER) == pull.get(zmq.LINGER) == 10
+
+
+def test_unknown_option(options):
+    with pytest.raises(AttributeError):
+        zt.configure(sockets={'push': {'no_such_option': 1}})
+
+
+def test_io_threads_after_sockets():
+    with zt.zmq_socket(zmq.PUSH):
+        pass
+    with pytest.raises(RuntimeError):
+        zt.configure(io_threads=2)
+
+
+def test_load_config(options, tmpdir):
+    path = tmpdir.join('zmq.json')
+    path.write(json.dumps({'sockets': {'pull': {'rcvhwm': 7}}}))
+    zt.load_config({'MISCHIEF_ZMQ_CONFIG': str(path),
+                    'MISCHIEF_ZMQ_PUSH_SNDHWM': '11',
+                    'MISCHIEF_ZMQ_ALL_TCP_KEEPALIVE': '1'})
+    assert options == {'ALL': {'LINGER': 5000, 'TCP_KEEPALIVE': '1'},
+                       'PULL': {'RCVHWM': 7}, 'PUSH': {'SNDHWM': '11'}}
+    with zt.zmq_socket(zmq.PUSH) as push:
+        assert push.get(zmq.SNDHWM) == 11
+        assert push.get(zmq.TCP_KEEPALIVE) == 1
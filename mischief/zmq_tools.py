@@ -1,3 +1,34 @@
+"""
+zmq tools
+=========
+
+All the sockets of mischief are created with ``new_socket`` (or
+``zmq_socket``), from the global ``Context``.
+
+The context and the sockets can be tuned with ``configure``::
+
+    configure(io_threads=4,
+              sockets={'all': {'linger': 1000},
+                       'push': {'sndhwm': 100000, 'tcp_keepalive': 1},
+                       'pull': {'rcvhwm': 100000, 'rcvbuf': 1 << 20}})
+
+Option names are the names of the zmq constants, in any case, and
+the keys of ``sockets`` are socket types (``'push'``, ``'router'``,
+...), or ``'all'``.  Options apply to the sockets created afterwards;
+``io_threads`` must be set before the first socket is created.
+
+The same configuration is loaded when this module is imported, from
+the JSON file named by ``MISCHIEF_ZMQ_CONFIG`` and then from
+environment variables such as::
+
+    MISCHIEF_ZMQ_IO_THREADS=4
+    MISCHIEF_ZMQ_PUSH_SNDHWM=100000
+    MISCHIEF_ZMQ_ALL_TCP_KEEPALIVE=1
+
+"""
+
+import json
+import os
 from contextlib import contextmanager
 
 import zmq
@@ -5,6 +36,83 @@ import zmq
 
 Context = zmq.Context()
 
+# Socket type (or 'ALL') -> {option name: value}.  Some time is
+# given to sockets to deliver messages when closing: we don't want
+# infinite time, since it may block when exiting the application.
+OPTIONS = {'ALL': {'LINGER': 5000}}
+
+ENV_PREFIX = 'MISCHIEF_ZMQ_'
+
+_sockets_created = False
+
+
+def configure(io_threads=None, sockets=None):
+    """Set the number of I/O threads and the options of new sockets."""
+    if io_threads is not None:
+        if _sockets_created:
+            raise RuntimeError(
+                'io_threads must be set before creating sockets')
+        Context.set(zmq.IO_THREADS, int(io_threads))
+    for kind, options in (sockets or {}).items():
+        kind = kind.upper()
+        if kind != 'ALL':
+            getattr(zmq, kind)
+        current = OPTIONS.setdefault(kind, {})
+        for name, value in options.items():
+            name = name.upper()
+            # fail early on unknown options
+            getattr(zmq, name)
+            current[name] = value
+
+
+def load_config(environ=None):
+    """Configure from the file in ``MISCHIEF_ZMQ_CONFIG`` and from
+    ``MISCHIEF_ZMQ_*`` environment variables."""
+    environ = os.environ if environ is None else environ
+    path = environ.get(ENV_PREFIX + 'CONFIG')
+    if path:
+        with open(path) as f:
+            configure(**json.load(f))
+    sockets = {}
+    io_threads = None
+    for key, value in environ.items():
+        if not key.startswith(ENV_PREFIX) or key == ENV_PREFIX + 'CONFIG':
+            continue
+        key = key[len(ENV_PREFIX):]
+        if key == 'IO_THREADS':
+            io_threads = value
+            continue
+        kind, _, name = key.partition('_')
+        sockets.setdefault(kind, {})[name] = value
+    configure(io_threads, sockets)
+
+
+def _value(value):
+    if isinstance(value, str) and value.lstrip('-').isdigit():
+        return int(value)
+    if not isinstance(value, (int, bytes)):
+        return value.encode('utf-8')
+    return value
+
+
+def new_socket(zmq_type):
+    """Create a socket with the configured options."""
+    global _sockets_created
+    _sockets_created = True
+    s = Context.socket(zmq_type)
+    options = dict(OPTIONS.get('ALL', ()))
+    options.update(OPTIONS.get(_type_name(zmq_type), ()))
+    for name, value in options.items():
+        s.setsockopt(getattr(zmq, name), _value(value))
+    return s
+
+
+def _type_name(zmq_type):
+    for name in ('PUSH', 'PULL', 'REQ', 'REP', 'PUB', 'SUB',
+                 'ROUTER', 'DEALER', 'PAIR', 'XPUB', 'XSUB'):
+        if getattr(zmq, name) == zmq_type:
+            return name
+
 
 @contextmanager
 def zmq_socket(zmq_type):
@@ -16,6 +124,9 @@ def zmq_socket(zmq_type):
             ...
 
     """
-    s = Context.socket(zmq_type)
+    s = new_socket(zmq_type)
     yield s
     s.close()
+
+
+load_config()